@@ -23,201 +23,253 @@ bl_info = {
     "blender": (2, 80, 0),
     "author": "Nicolas 'Duduf' Dufresne",
     "location": "3D View > Sidebar > Item",
-    "version": (1,2,0),
+    "version": (1,3,0),
     "description": "Eases animation using shape keys (clay animation) and corrective shape keys.",
     "wiki_url": "https://duska-docs.rainboxlab.org/",
 }
 
 import bpy # pylint: disable=import-error
 from bpy.app.handlers import persistent # pylint: disable=import-error
-from statistics import mean
+from time import perf_counter
+from array import array
+from fnmatch import fnmatchcase
 
 from .dublf import handlers as dublf_handlers # pylint: disable=import-error
 from .dublf import animation as dublf_animation # pylint: disable=import-error
+from . import registry
+from . import cache
+from . import bake
+from . import core
+from . import stats
+from . import groups
+from . import weightcache
+from . import tracking
+from . import prune
+from . import batch
+from . import native
+from . import integrity
 
 def is_shape_keyable(obj):
     if obj is None: return False
     return obj.type == 'CURVE' or obj.type == 'MESH'
 
 def get_shape_key(obj, ska):
-    shape_keys = obj.data.shape_keys
-    if shape_keys is None: return
-    for sk in shape_keys.key_blocks:
-        if not has_corresponding_key(sk, obj): continue
-        if ska.name == sk.name: return sk
-    return None
+    eval_map = cache.get_eval_map(obj)
+    if eval_map is None: return None
+    i = eval_map.indices.get(ska.name)
+    if i is None: return None
+    return obj.data.shape_keys.key_blocks[i]
 
 def set_shape_key(obj, ska):
     # check if there are shape keys
-    key = obj.data.shape_keys
-    if key is None: return
-    shape_keys = obj.data.shape_keys
-    if shape_keys is None: return
+    eval_map = cache.get_eval_map(obj)
+    if eval_map is None: return
 
     # set the right one
-    for sk in shape_keys.key_blocks:
-        if not is_ska_key(sk, obj): continue
-        if ska.name == sk.name:
-            sk.value = 1
-        else:
-            sk.value = 0
+    write_weights(obj, eval_map, core.resolve({ ska.name: 1.0 }, eval_map.managed, eval_map.indices))
+
+def write_weights(obj, eval_map, weights):
+    """Writes the values of the key_blocks ( { index: value } ) which differ from their current values"""
+    key_blocks = obj.data.shape_keys.key_blocks
+    # The values are read from the shape keys, which may be shared by several objects or edited by hand;
+    # they're stored as float32, the weights are rounded the same way to be compared
+    values = array('f', bytes(4 * len(key_blocks)))
+    key_blocks.foreach_get('value', values)
+    current = { i: values[i] for i in weights if i < len(values) }
+    changed = core.changed_weights(current, dict(zip(weights, array('f', weights.values()))), cache.write_stats)
+    if len(changed) == 0: return
+    for i, value in changed:
+        key_blocks[i].value = value
 
 def set_ska_values(obj, skas, values):
-    shape_keys = obj.data.shape_keys
-    if shape_keys is None: return
-
-    for i, ska in enumerate(skas):
-        for sk in shape_keys.key_blocks:
-            if sk.name == ska.name:     
-                sk.value = values[i]
-
-    for i, sk in enumerate(shape_keys.key_blocks):
-        if not is_ska_key(sk, obj): continue
-        ok = True
-        for ska in skas:
-            if sk.name == ska.name:
-                ok = False
-                break
-        if ok:
-            sk.value = 0
+    eval_map = cache.get_eval_map(obj)
+    if eval_map is None: return
+
+    # all the keys not in skas are set to 0
+    weights = { ska.name: value for ska, value in zip(skas, values) }
+    write_weights(obj, eval_map, core.resolve(weights, eval_map.managed, eval_map.indices))
+
+def get_objects(context, all_selected=False):
+    """The objects an operator works on: the active one, or all the selected ones"""
+    if not all_selected: return [context.object]
+    objects = [ obj for obj in context.selected_objects if is_shape_keyable(obj) ]
+    if context.object is not None and not context.object in objects: objects.insert(0, context.object)
+    return objects
 
 def getCurrentSka(obj, listIndex=0):
     """Returns the Current ska for the list"""
-    active_index = getActiveSkaIndex(obj, listIndex)
+    group = groups.get_group(obj, listIndex)
+    if group is None: return None
+    active_index = group.active_index
     if active_index < 0: return None
-    ska_keys = getattr(obj, 'ska_keys_' + str(listIndex))
+    ska_keys = group.keys
     num_keys = len(ska_keys)
     if active_index >= num_keys: return None
     return ska_keys[active_index]
 
 def getActiveSkaIndex(obj, listIndex=0):
-    return getattr(obj, 'ska_active_index_' + str(listIndex))
+    group = groups.get_group(obj, listIndex)
+    if group is None: return -1
+    return group.active_index
 
 def setActiveSka(obj, i, listIndex=0):
-    setattr(obj, 'ska_active_index_'+str(listIndex), i)
+    groups.get_group(obj, listIndex).active_index = i
 
 def getSkaKeys(obj, listIndex=0):
-    return getattr(obj, 'ska_keys_' + str(listIndex))
-
-def update_ska_index(obj, context=bpy.context):
-    """Updates the index of the Shape Key Animator"""
-    if not is_shape_keyable(obj): return
-
-    skavalues = [] # [ { 'ska':ska, 'values':[] }, ... ]
-
-    def addToValues(ska, val):
-        if val == 0: return
-        for v in skavalues:
-            if v['ska'].name == ska.name:
-                v['values'].append(val)
-                return
-
-        values = []
-        values.append(val)
-        s = {
-            'ska': ska,
-            'values': values
-        }
-        skavalues.append( s )
-
-    # if animated
+    group = groups.get_group(obj, listIndex)
+    if group is None: return []
+    return group.keys
+
+def get_ska_lists(obj, eval_map, frame=None):
+    """Collects the data of the SKA groups of the object for the evaluation core.
+    The weights of the groups are their current values, or evaluated at the frame if it's not None"""
+    curves = None
+    weight_curves = {}
     if dublf_animation.is_animated(obj):
-        # for lists
-        for i in range(0, 5):
-            
-            current_ska = getCurrentSka(obj, i)
-            if not current_ska: continue
-            
-            ska_keys = getSkaKeys(obj, i)
-
-            # get one or two values, add to skavalues
-            curves = dublf_animation.get_curves(obj, 'ska_active_index_'+str(i))
-            for fcurve in curves:
-                frame = context.scene.frame_current
-                # find keyframes
-                keyframes = fcurve.keyframe_points
-                # Juste one keyframe
-                if len(keyframes) < 2:
-                    addToValues(current_ska, 1.0)
+        # the active index curves of each group in use
+        curves = { i: [] for i in eval_map.groups }
+        action = obj.animation_data.action
+        if action is not None:
+            index_paths = eval_map.index_paths
+            weight_paths = eval_map.weight_paths
+            for fcurve in action.fcurves:
+                data_path = fcurve.data_path
+                i = index_paths.get(data_path)
+                if i is not None:
+                    curves[i].append( cache.get_keyframe_table(fcurve) )
                     continue
-                # Get the previous key
-                prev_key = dublf_animation.get_previous_keyframe(fcurve, frame)
-                if prev_key is None:
-                    addToValues(current_ska, 1.0)
-                    continue
-                prev_key_time = prev_key.co[0]
-                prev_key_value = ska_keys[int(prev_key.co[1])]
-                if prev_key.interpolation == 'CONSTANT':
-                    addToValues(prev_key_value, 1.0)
-                    continue
-                # Interpolate
-                next_key = dublf_animation.get_next_keyframe(fcurve, frame)
-                if next_key is None:
-                    addToValues(prev_key_value, 1.0)
-                    continue
-                next_key_time = next_key.co[0]
-                next_key_value = ska_keys[int(next_key.co[1])]
-                t = frame - prev_key_time
-                d = next_key_time - prev_key_time
-                if d == 0:
-                    ratio = 1
-                else:
-                    ratio = t / d
-                addToValues(prev_key_value, 1-ratio)
-                addToValues(next_key_value, ratio)
-    # not animated     
-    else:
-        # for lists
-        for i in range(0, 5):
-            current_ska = getCurrentSka(obj, i)
-            if not current_ska: continue
-            addToValues(current_ska, 1)
-
-    # Get the average for all skas
-    skas = []
-    values = []
-    for v in skavalues:
-        skas.append(v['ska'])
-        values.append(mean(v['values']))
-        set_ska_values(obj, skas, values)
-            
-def view_ska(obj, context, listIndex):
-    current_ska = getCurrentSka(obj, listIndex)
-    if not current_ska: return
-    set_shape_key(obj, current_ska)
-
-def view_ska_0(obj, context):
-    view_ska(obj, context, 0)
-
-def view_ska_1(obj, context):
-    view_ska(obj, context, 1)
-
-def view_ska_2(obj, context):
-    view_ska(obj, context, 2)
-
-def view_ska_3(obj, context):
-    view_ska(obj, context, 3)
-
-def view_ska_4(obj, context):
-    view_ska(obj, context, 4)
+                if frame is None: continue
+                i = weight_paths.get(data_path)
+                if i is not None:
+                    weight_curves[i] = fcurve
+
+    ska_groups = obj.ska_groups
+    ska_lists = []
+    for i in eval_map.groups:
+        group = ska_groups[i]
+        tables = None
+        if curves is not None: tables = curves[i]
+        weight_curve = weight_curves.get(i)
+        if weight_curve is not None: weight = weight_curve.evaluate(frame)
+        else: weight = group.weight
+        ska_lists.append( core.SkaList(eval_map.list_blocks[i], group.active_index, tables, weight) )
+    return ska_lists
+
+def evaluate(obj, frame):
+    """Returns the SKA weights of the object at the frame (which can be a subframe),
+    as { shape key name: weight } for all the shape keys animated by DuSKA;
+    an empty dict if the object is not animated by DuSKA or no group has an active key.
+    Nothing is changed: neither the shape keys nor the current frame of the scene.
+    When the shape keys are shared, the animation of the object driving them is used (see registry.py)"""
+    if not is_shape_keyable(obj): return {}
+    driver = registry.driver_of(obj)
+    if driver is not None: obj = driver
+    eval_map = cache.get_eval_map(obj)
+    if eval_map is None: return {}
+    weights = core.evaluate( get_ska_lists(obj, eval_map, frame), frame, obj.ska_blend_mode )
+    if len(weights) == 0: return {}
+    key_blocks = obj.data.shape_keys.key_blocks
+    return { key_blocks[i].name: weight for i, weight in core.resolve(weights, eval_map.managed).items() }
+
+def evaluate_range(obj, frames):
+    """Returns the SKA weights of the object for all the frames at once, without changing anything:
+    (names, weights), the names of the shape keys animated by DuSKA and a NumPy array (len(frames), len(names)).
+    When the shape keys are shared, the animation of the object driving them is used"""
+    if not is_shape_keyable(obj): return [], None
+    driver = registry.driver_of(obj)
+    if driver is not None: obj = driver
+    indices, weights = bake.evaluate_range(obj, frames)
+    if len(indices) == 0: return [], weights
+    key_blocks = obj.data.shape_keys.key_blocks
+    return [ key_blocks[i].name for i in indices ], weights
+
+def update_ska_index(obj, context=bpy.context):
+    """Updates the index of the Shape Key Animator.
+    Returns True if the object has been evaluated"""
+    if not is_shape_keyable(obj): return False
+    eval_map = cache.get_eval_map(obj)
+    if eval_map is None: return False
+
+    scene = context.scene
+    # with the subframe, for motion blur
+    frame = scene.frame_current_final
+    # Evaluated by the drivers of its shape keys
+    if obj.ska_native and native.is_native(obj, eval_map): return False
+    if obj.ska_weight_cache:
+        weights = weightcache.weights_at(obj, eval_map, scene, frame)
+        if weights is not None:
+            write_weights(obj, eval_map, weights)
+            return True
+
+    weights = compute_weights(obj, eval_map, frame)
+    if len(weights) == 0: return False
+    write_weights(obj, eval_map, weights)
+    return True
+
+def compute_weights(obj, eval_map, frame):
+    """Returns the weights { index: weight } of all the managed key_blocks at the frame,
+    an empty dict if no group is active. They're remembered by the EvalMap"""
+    # Already evaluated (prefetched, motion blur steps, multi-view, repeated frame changes)
+    weights = eval_map.recall(frame)
+    if weights is not None: return weights
+
+    # The weights of the groups are evaluated at the frame: the animation is evaluated after this handler
+    weights = core.evaluate( get_ska_lists(obj, eval_map, frame), frame, obj.ska_blend_mode )
+    if len(weights) > 0:
+        weights = core.resolve(weights, eval_map.managed)
+    eval_map.remember(frame, weights)
+    return weights
+
+# True while the frame handler is running, and during renders:
+# the frame handler then owns the evaluation and the update callbacks don't write anything
+_handler_running = False
+_rendering = False
+
+# The objects skipped while scrubbing or playing, evaluated when the frame stops changing
+_deferred = {} # { pointer: obj }
+_last_frame_time = 0.0
+CATCH_UP_DELAY = 0.2 # seconds
+
+SCRUB_SCOPES = (
+    ('ALL', "All objects", "All the objects are updated on each frame"),
+    ('VISIBLE', "Visible", "Only the visible objects are updated while scrubbing or playing the animation"),
+    ('SELECTED', "Selected", "Only the visible selected objects are updated while scrubbing or playing the animation"),
+)
+
+def handler_owns_evaluation(obj, context):
+    """Checks if the shape keys of the object are going to be written by the frame handler,
+    during playback and renders"""
+    if obj.ska_baked: return False
+    if _handler_running or _rendering: return True
+    screen = context.screen
+    return screen is not None and screen.is_animation_playing
+
+def view_ska(group, context):
+    """Previews the active key when it's changed in the interface or by a script"""
+    obj = group.id_data
+    # msgbus doesn't report the changes made with Python: the remembered weights must not be used anymore.
+    # The animation system doesn't call this, playback keeps using them
+    tracking.tag(obj)
+    # During playback, the value has been set by the animation, and the frame handler will interpolate it
+    if handler_owns_evaluation(obj, context): return
+    active_index = group.active_index
+    if active_index < 0 or active_index >= len(group.keys): return
+    set_shape_key(obj, group.keys[active_index])
+
+def update_group_weight(group, context):
+    # see view_ska
+    tracking.tag(group.id_data)
 
 def is_ska_key( sk, obj):
-    # for lists
-    for i in range(0, 5):
-        ska_keys = getSkaKeys(obj, i)
-        for ska in ska_keys:
-            if ska.name == sk.name: return True
-        return False
+    eval_map = cache.get_eval_map(obj)
+    if eval_map is None: return False
+    return sk.name in eval_map.indices
 
 def has_corresponding_key( ska, obj ):
     # check if there are shape keys
-    key = obj.data.shape_keys
-    if key is None: return False
-
-    # look for the right one
-    for sk in obj.data.shape_keys.key_blocks:
-        if sk.name == ska.name: return True
-    return False
+    eval_map = cache.get_eval_map(obj)
+    if eval_map is None: return False
+    return ska.name in eval_map.blocks
 
 def rename_ska(self, name):
     if name == '': return
@@ -227,19 +279,236 @@ def rename_ska(self, name):
     if sk is not None:
         sk.name = name
     self.ska_name = name
+    cache.invalidate(obj)
 
 def ska_name(self):
     return self.ska_name
 
+def update_baked(obj, context):
+    registry.update(obj)
+    # the drivers would override the baked values
+    if obj.ska_native:
+        native.update(obj)
+
+def update_native(obj, context):
+    native.update(obj)
+
+def update_weight_cache(obj, context):
+    if not obj.ska_weight_cache:
+        weightcache.remove(obj)
+
+def is_interactive(context):
+    """Checks if the frame changes because the user is scrubbing or playing the animation"""
+    if _rendering or bpy.app.background: return False
+    screen = context.screen
+    if screen is None: return False
+    return screen.is_animation_playing or getattr(screen, 'is_scrubbing', False)
+
+def interactive_objects(objects, scene, context):
+    """Filters the objects to update while scrubbing, according to the scope of the scene;
+    the other ones are deferred"""
+    global _last_frame_time
+    scope = scene.ska_scrub_scope
+    view_layer = context.view_layer
+    if scope == 'ALL' or view_layer is None: return objects
+    _last_frame_time = perf_counter()
+    selected = scope == 'SELECTED'
+    result = []
+    for obj in objects:
+        # The shape keys may be shared: one of the users must be shown
+        shown = False
+        for user in registry.users(obj):
+            if user.visible_get(view_layer=view_layer) and (not selected or user.select_get(view_layer=view_layer)):
+                shown = True
+                break
+        if shown:
+            result.append(obj)
+            _deferred.pop(obj.as_pointer(), None)
+        else:
+            _deferred[obj.as_pointer()] = obj
+    if len(_deferred) > 0 and not bpy.app.timers.is_registered(catch_up_timer):
+        bpy.app.timers.register(catch_up_timer, first_interval=CATCH_UP_DELAY)
+    return result
+
+def catch_up_timer():
+    """Updates the objects skipped while scrubbing, once the frame doesn't change anymore"""
+    context = bpy.context
+    if len(_deferred) == 0: return None
+    if is_interactive(context) or perf_counter() - _last_frame_time < CATCH_UP_DELAY:
+        return CATCH_UP_DELAY
+    objects = list(_deferred.values())
+    _deferred.clear()
+    for obj in objects:
+        try:
+            update_ska_index(obj, context)
+        except ReferenceError:
+            pass
+    return None
+
+PREFETCH_BUDGET = 0.004 # seconds of work each time the prefetch timer runs
+PREFETCH_INTERVAL = 0.01
+
+def next_frames(scene, num_frames):
+    """The frames which will be played after the current one"""
+    if scene.use_preview_range:
+        start, end = scene.frame_preview_start, scene.frame_preview_end
+    else:
+        start, end = scene.frame_start, scene.frame_end
+    frames = []
+    frame = scene.frame_current
+    for _ in range(num_frames):
+        frame = frame + 1
+        if frame > end: frame = start
+        frames.append(float(frame))
+    return frames
+
+def prefetch_timer():
+    """During playback, evaluates the next frames in advance, between redraws.
+    The weights are remembered by the EvalMaps, the frame handler then only writes them"""
+    context = bpy.context
+    scene = context.scene
+    screen = context.screen
+    if scene is None or screen is None or not screen.is_animation_playing: return None
+    if scene.ska_prefetch_frames <= 0: return None
+
+    deadline = perf_counter() + PREFETCH_BUDGET
+    eval_maps = []
+    for obj in registry.drivers():
+        try:
+            if obj.ska_weight_cache or obj.ska_native or obj.as_pointer() in _deferred: continue
+            eval_map = cache.get_eval_map(obj)
+        except ReferenceError:
+            registry.invalidate()
+            return PREFETCH_INTERVAL
+        if eval_map is None or not eval_map.memoize: continue
+        eval_maps.append( (obj, eval_map) )
+
+    # The cursors of the keyframe tables follow the playback, for the frame handler
+    cursors = cache.save_cursors()
+    try:
+        # The nearest frames first
+        for frame in next_frames(scene, scene.ska_prefetch_frames):
+            for obj, eval_map in eval_maps:
+                if eval_map.knows(frame): continue
+                compute_weights(obj, eval_map, frame)
+                # continue after the next frame
+                if perf_counter() > deadline: return scene.render.fps_base / scene.render.fps
+    finally:
+        cache.restore_cursors(cursors)
+    return PREFETCH_INTERVAL
+
+def update_prefetch(scene, context):
+    cache.set_prefetch(scene.ska_prefetch_frames)
+
 @persistent
 def update_keys_handler( scene ):
     """Updates all keys"""
-    for obj in bpy.data.objects:
-        update_ska_index(obj, bpy.context)
+    global _handler_running
+    context = bpy.context
+    # one object per shape keys datablock
+    objects = registry.drivers()
+    if is_interactive(context):
+        objects = interactive_objects(objects, scene, context)
+        if scene.ska_prefetch_frames > 0 and context.screen.is_animation_playing and not bpy.app.timers.is_registered(prefetch_timer):
+            cache.set_prefetch(scene.ska_prefetch_frames)
+            bpy.app.timers.register(prefetch_timer, first_interval=0.001)
+    elif len(_deferred) > 0:
+        # everything is updated anyway
+        _deferred.clear()
+    _handler_running = True
+    try:
+        if stats.enabled:
+            update_objects_timed(objects, scene)
+            return
+        for obj in objects:
+            try:
+                update_ska_index(obj, bpy.context)
+            except ReferenceError: # The object has been removed since the registry was built
+                registry.invalidate()
+    finally:
+        _handler_running = False
+
+def update_objects_timed(objects, scene):
+    """Same as update_keys_handler, recording the statistics"""
+    record = stats.begin_frame(scene.frame_current, len(objects))
+    write_stats = cache.write_stats
+    written = write_stats.written
+    skipped = write_stats.skipped
+    for obj in objects:
+        start = perf_counter()
+        try:
+            name = obj.name
+            evaluated = update_ska_index(obj, bpy.context)
+        except ReferenceError:
+            registry.invalidate()
+            continue
+        record.add_object(name, perf_counter() - start, evaluated)
+    stats.end_frame(record, write_stats.written - written, write_stats.skipped - skipped)
+
+@persistent
+def render_init_handler( dummy ):
+    global _rendering
+    _rendering = True
+
+@persistent
+def render_end_handler( dummy ):
+    global _rendering
+    _rendering = False
+
+@persistent
+def load_handler( dummy ):
+    """Migrates the files from DuSKA 1.2, checks the Animated Keys and rebuilds the registry of animated objects"""
+    groups.migrate_all()
+    if integrity.scan().num_broken > 0:
+        print("DuSKA: " + integrity.report.message())
+    cache.clear()
+    weightcache.clear()
+    native.clear()
+    _deferred.clear()
+    registry.rebuild()
+    native.schedule_all(registry.drivers())
+
+@persistent
+def save_handler( dummy ):
+    """Records the shape keys used by the Animated Keys, to repair them if they're renamed"""
+    integrity.record_indices()
+
+@persistent
+def depsgraph_update_handler( scene, depsgraph=None ):
+    """Invalidates the caches of the edited actions and objects"""
+    if depsgraph is None: depsgraph = bpy.context.evaluated_depsgraph_get()
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Action):
+            action = update.id.original
+            cache.invalidate_action(action)
+            tracking.tag_action(action, registry.objects())
+        elif isinstance(update.id, bpy.types.Object):
+            # Properties edited; transforms and geometry (including the shape key values written by DuSKA) don't matter
+            if update.is_updated_transform or update.is_updated_geometry: continue
+            tracking.tag(update.id.original)
+
+@persistent
+def undo_handler( dummy ):
+    """Undo/Redo may have changed the lists, the registry and caches will be rebuilt"""
+    cache.clear()
+    weightcache.clear()
+    native.clear()
+    _deferred.clear()
+    # rebuilt now to subscribe to the changes of the restored data
+    registry.rebuild()
+    native.schedule_all(registry.drivers())
 
 class DUSKA_key( bpy.types.PropertyGroup ):
     name: bpy.props.StringProperty( default="SKA.key", set=rename_ska, get=ska_name )
     ska_name:bpy.props.StringProperty()
+    # the index of the shape key when the file was last saved, see integrity.py
+    block_index:bpy.props.IntProperty( default=-1 )
+
+class DUSKA_group( bpy.types.PropertyGroup ):
+    keys: bpy.props.CollectionProperty( type=DUSKA_key )
+    active_index: bpy.props.IntProperty( default=-1, update=view_ska, options={'ANIMATABLE','LIBRARY_EDITABLE'} )
+    weight: bpy.props.FloatProperty( name="Weight", default=1.0, min=0.0, max=1.0, options={'ANIMATABLE','LIBRARY_EDITABLE'}, update=update_group_weight,
+        description="The influence of this group when it's blended with the other ones" )
 
 class DUSKA_OT_edit( bpy.types.Operator ):
     bl_idname = "object.ska_edit_key"
@@ -259,15 +528,12 @@ class DUSKA_OT_edit( bpy.types.Operator ):
         obj = context.object
         current_ska = getCurrentSka(obj, self.listIndex)
         if not current_ska: return {'CANCELLED'}
-        current_ska_name = current_ska.name
 
-        ok = False
-        for i, s in enumerate(obj.data.shape_keys.key_blocks):
-            if s.name == current_ska_name:
-                obj.active_shape_key_index = i
-                ok = True
-                break
-        if ok:
+        eval_map = cache.get_eval_map(obj)
+        if eval_map is None: return {'CANCELLED'}
+        i = eval_map.blocks.get(current_ska.name)
+        if i is not None:
+            obj.active_shape_key_index = i
             if self.sculpt:
                 bpy.ops.object.mode_set(mode='SCULPT')
             else:
@@ -282,6 +548,7 @@ class DUSKA_OT_include_key( bpy.types.Operator ):
     bl_options = {'REGISTER','UNDO'}
 
     listIndex: bpy.props.IntProperty(default=0)
+    all_selected: bpy.props.BoolProperty(name="All selected objects", default=False)
 
     @classmethod
     def poll(cls, context):
@@ -293,15 +560,7 @@ class DUSKA_OT_include_key( bpy.types.Operator ):
         return True
 
     def execute(self, context):
-        obj = context.object
-
-        shape_keys = obj.data.shape_keys.key_blocks
-        active_shape_key = shape_keys[obj.active_shape_key_index]
-
-        ska_keys = getSkaKeys(obj, self.listIndex)
-        ska = ska_keys.add()
-        ska.ska_name = active_shape_key.name
-
+        batch.include_key(get_objects(context, self.all_selected), self.listIndex)
         return {'FINISHED'}
 
 class DUSKA_OT_add_key( bpy.types.Operator ):
@@ -312,6 +571,7 @@ class DUSKA_OT_add_key( bpy.types.Operator ):
 
     from_mix: bpy.props.BoolProperty(default=False)
     listIndex: bpy.props.IntProperty(default=0)
+    all_selected: bpy.props.BoolProperty(name="All selected objects", default=False)
 
     @classmethod
     def poll(cls, context):
@@ -319,44 +579,11 @@ class DUSKA_OT_add_key( bpy.types.Operator ):
         return is_shape_keyable(obj)
 
     def execute(self, context):
-        obj = context.object
-        ska_keys = getSkaKeys(obj, self.listIndex)
-        # Add a new key
-        sk = obj.shape_key_add(name='SKA.Key', from_mix=self.from_mix)
-        ska = ska_keys.add()
-        ska.ska_name = sk.name
-        shape_keys = obj.data.shape_keys.key_blocks
-        num_keys = len(shape_keys)
-        if num_keys == 1: # if it's the first, it's the basis
-            sk.name = 'Basis'
-            ska.ska_name = sk.name
-            sk = obj.shape_key_add(name='SKA.Key', from_mix=False)
-            ska = ska_keys.add()
-            ska.ska_name = sk.name
-        else: # let's check if the basis is there, if not add it
-            create_basis = True
-            basis_name = shape_keys[0].name
-            for ska_key in ska_keys:
-                if ska_key.name == basis_name:
-                    create_basis = False
-                    break
-            if create_basis:
-                ska_basis = ska_keys.add()
-                ska_basis.ska_name = basis_name
-
-        i = len(shape_keys)-1
-        iSka = len(getSkaKeys(obj, self.listIndex)) -1
-        obj.active_shape_key_index = i
-        setActiveSka(obj, iSka, self.listIndex)
-
+        frame = None
         # If autokey is active and there are keyframes, add a keyframe
         if context.tool_settings.use_keyframe_insert_auto:
-            curves = dublf_animation.get_curves(obj, 'ska_active_index_'+str(self.listIndex))
-            for curve in curves:
-                keyframes = curve.keyframe_points
-                if len(keyframes) > 0:
-                    keyframes.insert(context.scene.frame_current, iSka)
-        
+            frame = context.scene.frame_current
+        batch.add_key(get_objects(context, self.all_selected), self.listIndex, self.from_mix, frame=frame)
         return {'FINISHED'}
 
 class DUSKA_OT_remove_key(bpy.types.Operator ):
@@ -367,6 +594,7 @@ class DUSKA_OT_remove_key(bpy.types.Operator ):
 
     delete: bpy.props.BoolProperty(default=False)
     listIndex: bpy.props.IntProperty(default=0)
+    all_selected: bpy.props.BoolProperty(name="All selected objects", default=False)
 
     @classmethod
     def poll(cls, context):
@@ -374,26 +602,8 @@ class DUSKA_OT_remove_key(bpy.types.Operator ):
         return is_shape_keyable(obj)
 
     def execute(self, context):
-        obj = context.object
-        current_ska = getCurrentSka(obj, self.listIndex)
-        if not current_ska: return {'CANCELLED'}
-
-        # remove all keyframes referencing this ska
-        # and adjust values of other keyframes to continue referencing the right skas
-        active_index = getActiveSkaIndex(obj, self.listIndex)
-        dublf_animation.remove_animated_index(obj, 'ska_active_index_'+str(self.listIndex), active_index )
-
-        if not obj.data.shape_keys:
-            self.delete = False
-
-        if self.delete:
-            shape_key = get_shape_key(obj, getCurrentSka(obj, self.listIndex))
-            shape_keys = obj.data.shape_keys.key_blocks
-            if shape_key is not None:
-                if shape_key.name != shape_keys[0].name: # Do not delete basis
-                    obj.shape_key_remove( shape_key )
-        ska_keys = getSkaKeys(obj, self.listIndex)
-        ska_keys.remove( getActiveSkaIndex(obj, self.listIndex) )
+        changed = batch.remove_key(get_objects(context, self.all_selected), self.listIndex, self.delete)
+        if len(changed) == 0: return {'CANCELLED'}
         return {'FINISHED'}
 
 class DUSKA_OT_move_ska( bpy.types.Operator ):
@@ -426,9 +636,10 @@ class DUSKA_OT_move_ska( bpy.types.Operator ):
         else: new_index = current_index + 1
 
         # update keyframes values
-        dublf_animation.swap_animated_index(obj, 'ska_active_index_'+str(self.listIndex), current_index, new_index)
+        groups.move_index(obj, self.listIndex, current_index, new_index)
 
         skas.move(current_index, new_index)
+        cache.invalidate(obj)
         setActiveSka(obj, new_index, self.listIndex)
 
         return {'FINISHED'}
@@ -441,6 +652,7 @@ class DUSKA_OT_delete_all_keys( bpy.types.Operator ):
 
     delete: bpy.props.BoolProperty(default=False)
     listIndex: bpy.props.IntProperty(default=0)
+    all_selected: bpy.props.BoolProperty(name="All selected objects", default=False)
 
     @classmethod
     def poll(cls, context):
@@ -448,25 +660,8 @@ class DUSKA_OT_delete_all_keys( bpy.types.Operator ):
         return is_shape_keyable(obj)
 
     def execute(self, context):
-        obj = context.object
-
-        # remove all keyframes animation
-        dublf_animation.remove_all_keyframes(obj, 'ska_active_index_'+str(self.listIndex) )
-
-        if not obj.data.shape_keys:
-            self.delete = False
-        else:
-            shape_keys = obj.data.shape_keys.key_blocks
-
-        ska_keys = getSkaKeys(obj, self. listIndex)
-        while len(ska_keys) > 0:
-            if self.delete:
-                shape_key = get_shape_key(obj, ska_keys[0])
-                if shape_key is not None:
-                    if shape_key.name != shape_keys[0].name: # Do not delete basis
-                        obj.shape_key_remove( shape_key )
-            ska_keys.remove( 0 )
-
+        changed = batch.delete_all_keys(get_objects(context, self.all_selected), self.listIndex, self.delete)
+        if len(changed) == 0: return {'CANCELLED'}
         return {'FINISHED'}
 
 def draw_menu(layout, listIndex):
@@ -493,60 +688,67 @@ def draw_menu(layout, listIndex):
     op = layout.operator("object.ska_delete_all", icon='X', text="Delete All Shape Keys")
     op.delete = True
     op.listIndex = listIndex
+    layout.separator()
+    layout.label(text="All selected objects:")
+    op = layout.operator("object.ska_add_key", icon='ADD', text="New Animated Key")
+    op.from_mix = False
+    op.listIndex = listIndex
+    op.all_selected = True
+    op = layout.operator("object.ska_include_key", icon='ADD', text="Add active Shape Keys to animation")
+    op.listIndex = listIndex
+    op.all_selected = True
+    op = layout.operator("object.ska_remove_key", icon='REMOVE', text="Remove active Animated Keys from animation")
+    op.delete = False
+    op.listIndex = listIndex
+    op.all_selected = True
+    op = layout.operator("object.ska_delete_all", icon='REMOVE', text="Remove All Animated Keys from animation")
+    op.delete = False
+    op.listIndex = listIndex
+    op.all_selected = True
+    layout.separator()
+    layout.operator("object.ska_prune_keys", icon='VIEWZOOM', text="Find Duplicate Shape Keys")
+    layout.operator("object.ska_repair_keys", icon='TOOL_SETTINGS', text="Repair Animated Keys (all objects)")
+    layout.operator("object.ska_bake", icon='ACTION', text="Bake SKA to Shape Key Values")
 
-class DUSKA_MT_menu0( bpy.types.Menu ):
-    bl_label = 'SKA'
-    bl_idname = 'DUSKA_MT_menu0'
-
-    def draw(self, context):
-        layout = self.layout
-        draw_menu(layout, 0)
-            
-class DUSKA_MT_menu1( bpy.types.Menu ):
-    bl_label = 'SKA'
-    bl_idname = 'DUSKA_MT_menu1'
-
-    def draw(self, context):
-        layout = self.layout
-        draw_menu(layout, 1)
-
-class DUSKA_MT_menu2( bpy.types.Menu ):
-    bl_label = 'SKA'
-    bl_idname = 'DUSKA_MT_menu2'
-
-    def draw(self, context):
-        layout = self.layout
-        draw_menu(layout, 2)
-
-class DUSKA_MT_menu3( bpy.types.Menu ):
-    bl_label = 'SKA'
-    bl_idname = 'DUSKA_MT_menu3'
-
-    def draw(self, context):
-        layout = self.layout
-        draw_menu(layout, 3)
-
-class DUSKA_MT_menu4( bpy.types.Menu ):
+class DUSKA_MT_menu( bpy.types.Menu ):
     bl_label = 'SKA'
-    bl_idname = 'DUSKA_MT_menu4'
+    bl_idname = 'DUSKA_MT_menu'
 
     def draw(self, context):
         layout = self.layout
-        draw_menu(layout, 4)
+        group = getattr(context, 'ska_group', None)
+        if group is None: return
+        draw_menu(layout, groups.group_index(group))
 
 class DUSKA_UL_keys( bpy.types.UIList ):
     """The list of shape keys on an object"""
     bl_idname = "DUSKA_UL_keys"
 
-    def draw_item(self, context, layout, data, item, icon, active_data, active_propname):
-        if has_corresponding_key(item, data):
-            obj = context.object
-            i = 'SHAPEKEY_DATA'
-            if obj.data.shape_keys.key_blocks[0].name == item.name:
-                i = 'MESH_DATA'
-            layout.prop(item, 'name', text='', emboss=False, icon=i)
-        else:
-            layout.prop(item, 'name', text='', emboss=False, icon='ERROR')
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index=0):
+        # The icons are cached with the EvalMap, until the keys or shape keys are edited
+        icons = []
+        eval_map = cache.get_eval_map(item.id_data)
+        if eval_map is not None:
+            icons = eval_map.list_icons(groups.group_index(data))
+        i = 'ERROR'
+        if index < len(icons): i = icons[index]
+        layout.prop(item, 'name', text='', emboss=False, icon=i)
+
+    def filter_items(self, context, data, propname):
+        """Filters by name (case insensitive, with wildcards as the other lists of Blender), and sorts alphabetically"""
+        flags = []
+        order = []
+        if not self.filter_name and not self.use_filter_sort_alpha: return flags, order
+
+        names = [ key.ska_name for key in getattr(data, propname) ]
+        if self.filter_name:
+            pattern = '*' + self.filter_name.lower() + '*'
+            flags = [ self.bitflag_filter_item if fnmatchcase(name.lower(), pattern) else 0 for name in names ]
+        if self.use_filter_sort_alpha:
+            order = [0] * len(names)
+            for new_index, old_index in enumerate(sorted(range(len(names)), key=lambda i: names[i].lower())):
+                order[old_index] = new_index
+        return flags, order
 
 class DUSKA_PT_keys_control( bpy.types.Panel ):
     bl_space_type = 'VIEW_3D'
@@ -564,16 +766,35 @@ class DUSKA_PT_keys_control( bpy.types.Panel ):
         layout = self.layout
         obj = context.object
 
-        first_empty_list = -1
-
-        for i in range(0,5):
-            num_keys = len(getSkaKeys(obj, i))
-            if num_keys == 0:
-                if first_empty_list == -1:
-                    first_empty_list = i
+        if obj.ska_baked:
+            row = layout.row()
+            row.label(text="Baked to Shape Key values", icon='ACTION')
+            row.operator("object.ska_clear_bake", icon='X', text="")
+        else:
+            driver = registry.driver_of(obj)
+            if driver is not None and driver != obj:
+                layout.label(text="Shape Keys animated by " + driver.name, icon='LINKED')
+        eval_map = cache.get_eval_map(obj)
+        if eval_map is not None and any(None in blocks for blocks in eval_map.list_blocks):
+            row = layout.row()
+            row.label(text="Some Animated Keys have lost their Shape Key", icon='ERROR')
+            row.operator("object.ska_repair_keys", icon='TOOL_SETTINGS', text="")
+        if obj.name_full in groups.unmigrated:
+            layout.label(text="Made with DuSKA 1.2 in a linked file: save the library with this version", icon='ERROR')
+
+        ska_groups = obj.ska_groups
+        num_groups = 0
+        first_empty_group = -1
+        for group in ska_groups:
+            if len(group.keys) > 0: num_groups = num_groups + 1
+
+        for i, group in enumerate(ska_groups):
+            if len(group.keys) == 0:
+                if first_empty_group == -1:
+                    first_empty_group = i
                 continue
             row = layout.row()
-            row.template_list("DUSKA_UL_keys", "", obj , "ska_keys_"+str(i), obj , "ska_active_index_"+str(i) , rows = 3 )
+            row.template_list("DUSKA_UL_keys", str(i), group, "keys", group, "active_index", rows = 3 )
             col = row.column(align=True)
             op = col.operator("object.ska_add_key", icon='ADD', text="")
             op.from_mix = True
@@ -585,7 +806,8 @@ class DUSKA_PT_keys_control( bpy.types.Panel ):
             op.sculpt = True
             op.listIndex = i
             col.separator()
-            col.menu("DUSKA_MT_menu"+str(i), icon='DOWNARROW_HLT', text="")
+            col.context_pointer_set("ska_group", group)
+            col.menu("DUSKA_MT_menu", icon='DOWNARROW_HLT', text="")
             col.separator()
             op = col.operator('object.ska_move_key',  icon='TRIA_UP', text="")
             op.up = True
@@ -593,73 +815,201 @@ class DUSKA_PT_keys_control( bpy.types.Panel ):
             op = col.operator('object.ska_move_key',  icon='TRIA_DOWN', text="")
             op.up = False
             op.listIndex = i
-        
-        if first_empty_list > -1:
-            row = layout.row()
-            op = row.operator("object.ska_add_key", icon='ADD', text="New animated key group")
-            op.from_mix = True
-            op.listIndex = first_empty_list
-        
+            if num_groups > 1:
+                layout.prop(group, 'weight', slider=True)
+
+        row = layout.row()
+        op = row.operator("object.ska_add_key", icon='ADD', text="New animated key group")
+        op.from_mix = True
+        if first_empty_group > -1:
+            op.listIndex = first_empty_group
+        else:
+            op.listIndex = len(ska_groups)
+
+        if num_groups > 1:
+            layout.prop(obj, 'ska_blend_mode')
+
+class DUSKA_PT_performance( bpy.types.Panel ):
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_label = "Performance"
+    bl_idname = "DUSKA_PT_performance"
+    bl_parent_id = "DUSKA_PT_keys_controls"
+    bl_category = 'Item'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(context.scene, 'ska_scrub_scope')
+        layout.prop(context.scene, 'ska_prefetch_frames')
+        layout.prop(context.object, 'ska_weight_cache')
+        layout.prop(context.object, 'ska_native')
+        if context.object.ska_native and not native.is_compiled(context.object):
+            layout.label(text="Can't be evaluated natively, evaluated by DuSKA", icon='INFO')
+        layout.prop(context.window_manager, 'duska_profiling')
+        if not stats.enabled: return
+
+        summary = stats.summary()
+        if summary is None:
+            layout.label(text="Play the animation to collect statistics.")
+            return
+
+        col = layout.column(align=True)
+        col.label(text="Last " + str(summary['frames']) + " frames:")
+        col.label(text="Time p50: {:.2f} ms".format(summary['time_p50_ms']))
+        col.label(text="Time p95: {:.2f} ms".format(summary['time_p95_ms']))
+        col.label(text="Time max: {:.2f} ms".format(summary['time_max_ms']))
+        col.label(text="Objects visited: {:.0f}".format(summary['visited']))
+        col.label(text="Objects evaluated: {:.0f}".format(summary['evaluated']))
+        col.label(text="Shape key writes: {:.0f}".format(summary['writes']))
+        col.label(text="Unchanged, skipped: {:.0f}".format(summary['skipped']))
+        if len(summary['slowest']) > 0:
+            col = layout.column(align=True)
+            col.label(text="Slowest objects:")
+            for name, time in summary['slowest']:
+                col.label(text="{}: {:.2f} ms".format(name, time))
+        layout.operator("wm.ska_reset_stats", icon='FILE_REFRESH', text="Reset")
+
+class DUSKA_OT_reset_stats( bpy.types.Operator ):
+    bl_idname = "wm.ska_reset_stats"
+    bl_label = "Reset DuSKA Statistics"
+    bl_description = "Clears the performance statistics of DuSKA"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        stats.reset()
+        cache.write_stats.reset()
+        return {'FINISHED'}
+
+def update_profiling(wm, context):
+    stats.enable(wm.duska_profiling)
+    stats.reset()
+    cache.write_stats.reset()
+
 classes = (
     DUSKA_key,
+    DUSKA_group,
     DUSKA_OT_edit,
     DUSKA_OT_include_key,
     DUSKA_OT_add_key,
     DUSKA_OT_remove_key,
     DUSKA_OT_move_ska,
     DUSKA_OT_delete_all_keys,
-    DUSKA_MT_menu0,
-    DUSKA_MT_menu1,
-    DUSKA_MT_menu2,
-    DUSKA_MT_menu3,
-    DUSKA_MT_menu4,
+    bake.DUSKA_OT_bake,
+    bake.DUSKA_OT_clear_bake,
+    prune.DUSKA_OT_prune_keys,
+    integrity.DUSKA_OT_repair_keys,
+    DUSKA_MT_menu,
     DUSKA_UL_keys,
     DUSKA_PT_keys_control,
+    DUSKA_PT_performance,
+    DUSKA_OT_reset_stats,
 )
 
 def register():
     # register
     for cls in classes:
         bpy.utils.register_class(cls)
-
-    if not hasattr( bpy.types.Object, 'ska_active_index_0'):
-        bpy.types.Object.ska_active_index_0 = bpy.props.IntProperty( default=-1, update=view_ska_0, options={'ANIMATABLE','LIBRARY_EDITABLE'} )
-    if not hasattr( bpy.types.Object, 'ska_keys_0'):
-        bpy.types.Object.ska_keys_0 = bpy.props.CollectionProperty( type=DUSKA_key )
-    if not hasattr( bpy.types.Object, 'ska_active_index_1'):
-        bpy.types.Object.ska_active_index_1 = bpy.props.IntProperty( default=-1, update=view_ska_1, options={'ANIMATABLE','LIBRARY_EDITABLE'} )
-    if not hasattr( bpy.types.Object, 'ska_keys_1'):
-        bpy.types.Object.ska_keys_1 = bpy.props.CollectionProperty( type=DUSKA_key )
-    if not hasattr( bpy.types.Object, 'ska_active_index_2'):
-        bpy.types.Object.ska_active_index_2 = bpy.props.IntProperty( default=-1, update=view_ska_2, options={'ANIMATABLE','LIBRARY_EDITABLE'} )
-    if not hasattr( bpy.types.Object, 'ska_keys_2'):
-        bpy.types.Object.ska_keys_2 = bpy.props.CollectionProperty( type=DUSKA_key )
-    if not hasattr( bpy.types.Object, 'ska_active_index_3'):
-        bpy.types.Object.ska_active_index_3 = bpy.props.IntProperty( default=-1, update=view_ska_3, options={'ANIMATABLE','LIBRARY_EDITABLE'} )
-    if not hasattr( bpy.types.Object, 'ska_keys_3'):
-        bpy.types.Object.ska_keys_3 = bpy.props.CollectionProperty( type=DUSKA_key )
-    if not hasattr( bpy.types.Object, 'ska_active_index_4'):
-        bpy.types.Object.ska_active_index_4 = bpy.props.IntProperty( default=-1, update=view_ska_4, options={'ANIMATABLE','LIBRARY_EDITABLE'} )
-    if not hasattr( bpy.types.Object, 'ska_keys_4'):
-        bpy.types.Object.ska_keys_4 = bpy.props.CollectionProperty( type=DUSKA_key )
-
-    # Add handler
+    native.register()
+
+    if not hasattr( bpy.types.Object, 'ska_groups'):
+        bpy.types.Object.ska_groups = bpy.props.CollectionProperty( type=DUSKA_group )
+    # The lists of DuSKA 1.2, only kept to migrate the files
+    for i in range(0, groups.NUM_LEGACY_LISTS):
+        if not hasattr( bpy.types.Object, 'ska_active_index_' + str(i)):
+            setattr( bpy.types.Object, 'ska_active_index_' + str(i), bpy.props.IntProperty( default=-1, options={'ANIMATABLE','LIBRARY_EDITABLE'} ) )
+        if not hasattr( bpy.types.Object, 'ska_keys_' + str(i)):
+            setattr( bpy.types.Object, 'ska_keys_' + str(i), bpy.props.CollectionProperty( type=DUSKA_key ) )
+    if not hasattr( bpy.types.WindowManager, 'duska_profiling'):
+        bpy.types.WindowManager.duska_profiling = bpy.props.BoolProperty( name="Record statistics", default=False, update=update_profiling,
+            description="Measures the time spent by DuSKA on each frame" )
+    if not hasattr( bpy.types.Object, 'ska_blend_mode'):
+        bpy.types.Object.ska_blend_mode = bpy.props.EnumProperty( name="Blend", items=core.BLEND_MODES, default='MEAN',
+            description="How the weights of the different groups are combined", options={'LIBRARY_EDITABLE'} )
+    if not hasattr( bpy.types.Scene, 'ska_scrub_scope'):
+        bpy.types.Scene.ska_scrub_scope = bpy.props.EnumProperty( name="Update while scrubbing", items=SCRUB_SCOPES, default='ALL',
+            description="The objects updated while scrubbing or playing the animation; the other ones are updated when the frame stops changing. Renders always update all the objects" )
+    if not hasattr( bpy.types.Scene, 'ska_prefetch_frames'):
+        bpy.types.Scene.ska_prefetch_frames = bpy.props.IntProperty( name="Prefetch frames", default=0, min=0, soft_max=24, update=update_prefetch,
+            description="During playback, the next frames are evaluated in advance, between redraws. 0 to disable" )
+    if not hasattr( bpy.types.Object, 'ska_weight_cache'):
+        bpy.types.Object.ska_weight_cache = bpy.props.BoolProperty( name="Cache weights", default=False, update=update_weight_cache,
+            description="Stores the weights of all the frames of the scene in the file; they're evaluated again only when the animation changes",
+            options={'LIBRARY_EDITABLE'} )
+    if not hasattr( bpy.types.Object, 'ska_native'):
+        bpy.types.Object.ska_native = bpy.props.BoolProperty( name="Native evaluation", default=False, update=update_native,
+            description="Compiles the animation to drivers on the Shape Keys, evaluated by Blender on several threads. "
+                "They're compiled again when the animation changes; objects which can't be compiled are still evaluated by DuSKA" )
+    if not hasattr( bpy.types.Object, 'ska_baked'):
+        bpy.types.Object.ska_baked = bpy.props.BoolProperty( default=False, update=update_baked, options={'LIBRARY_EDITABLE'} )
+
+    # Add handlers
     dublf_handlers.frame_change_pre_append( update_keys_handler )
-    
+    if not load_handler in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append( load_handler )
+    if not save_handler in bpy.app.handlers.save_pre:
+        bpy.app.handlers.save_pre.append( save_handler )
+    if not depsgraph_update_handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append( depsgraph_update_handler )
+    if not undo_handler in bpy.app.handlers.undo_post:
+        bpy.app.handlers.undo_post.append( undo_handler )
+    if not undo_handler in bpy.app.handlers.redo_post:
+        bpy.app.handlers.redo_post.append( undo_handler )
+    if not render_init_handler in bpy.app.handlers.render_init:
+        bpy.app.handlers.render_init.append( render_init_handler )
+    for handlers in (bpy.app.handlers.render_complete, bpy.app.handlers.render_cancel):
+        if not render_end_handler in handlers:
+            handlers.append( render_end_handler )
+    registry.invalidate()
+    # Migrate the current file, bpy.data is not available during registration
+    bpy.app.timers.register( migrate_timer, first_interval=0 )
+
+def migrate_timer():
+    """Migrates the file opened when the add-on is enabled"""
+    if groups.migrate_all() > 0:
+        cache.clear()
+        weightcache.clear()
+        registry.invalidate()
+    return None
+
 def unregister():
-    # Remove handler
+    tracking.unsubscribe_all()
+    # Remove handlers
     dublf_handlers.frame_change_pre_remove( update_keys_handler )
-
-    del bpy.types.Object.ska_keys_0
-    del bpy.types.Object.ska_active_index_0
-    del bpy.types.Object.ska_keys_1
-    del bpy.types.Object.ska_active_index_1
-    del bpy.types.Object.ska_keys_2
-    del bpy.types.Object.ska_active_index_2
-    del bpy.types.Object.ska_keys_3
-    del bpy.types.Object.ska_active_index_3
-    del bpy.types.Object.ska_keys_4
-    del bpy.types.Object.ska_active_index_4
+    if load_handler in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove( load_handler )
+    if save_handler in bpy.app.handlers.save_pre:
+        bpy.app.handlers.save_pre.remove( save_handler )
+    if depsgraph_update_handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove( depsgraph_update_handler )
+    if undo_handler in bpy.app.handlers.undo_post:
+        bpy.app.handlers.undo_post.remove( undo_handler )
+    if undo_handler in bpy.app.handlers.redo_post:
+        bpy.app.handlers.redo_post.remove( undo_handler )
+    if render_init_handler in bpy.app.handlers.render_init:
+        bpy.app.handlers.render_init.remove( render_init_handler )
+    for handlers in (bpy.app.handlers.render_complete, bpy.app.handlers.render_cancel):
+        if render_end_handler in handlers:
+            handlers.remove( render_end_handler )
+
+    del bpy.types.Object.ska_groups
+    for i in range(0, groups.NUM_LEGACY_LISTS):
+        delattr( bpy.types.Object, 'ska_keys_' + str(i) )
+        delattr( bpy.types.Object, 'ska_active_index_' + str(i) )
+    del bpy.types.Object.ska_baked
+    del bpy.types.Object.ska_weight_cache
+    del bpy.types.Object.ska_native
+    native.unregister()
+    del bpy.types.Scene.ska_scrub_scope
+    del bpy.types.Scene.ska_prefetch_frames
+    if bpy.app.timers.is_registered(prefetch_timer):
+        bpy.app.timers.unregister(prefetch_timer)
+    if bpy.app.timers.is_registered(catch_up_timer):
+        bpy.app.timers.unregister(catch_up_timer)
+    _deferred.clear()
+    del bpy.types.Object.ska_blend_mode
+    del bpy.types.WindowManager.duska_profiling
+    stats.enable(False)
 
     # unregister
     for cls in reversed(classes):
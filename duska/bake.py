@@ -0,0 +1,257 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Bakes the SKA animation to the values of the shape keys.
+
+All the frames of an object are evaluated at once with NumPy, following the same rules as core.evaluate,
+and written as key_blocks[...].value fcurves with foreach_set.
+"""
+
+import numpy as np
+import bpy # pylint: disable=import-error
+
+from .dublf import animation as dublf_animation # pylint: disable=import-error
+from . import registry
+from . import cache
+from . import groups
+
+_linear_interpolation = None
+
+def evaluate_range(obj, frames):
+    """Evaluates the SKA weights of the object for all the frames at once.
+    Returns the indices of the key_blocks managed by DuSKA,
+    and the array of their weights, with the shape (len(frames), len(indices))"""
+    eval_map = cache.get_eval_map(obj)
+    if eval_map is None: return [], None
+
+    indices = sorted(eval_map.managed)
+    columns = { block: c for c, block in enumerate(indices) }
+    frames = np.asarray(frames, dtype=np.float64)
+    num_frames = len(frames)
+    rows = np.arange(num_frames)
+    shape = (num_frames, len(indices))
+    weights = np.zeros(shape)
+    counts = np.zeros(shape) # the lists using each key, for MEAN
+    mode = obj.ska_blend_mode
+
+    def add(list_weights, ska_columns, ska_indices, key_weights):
+        # Same as Accumulator.add: weights of the same key are added inside a list
+        valid = (ska_indices >= 0) & (ska_indices < len(ska_columns))
+        cols = ska_columns[np.where(valid, ska_indices, 0)]
+        keep = valid & (cols >= 0) & (key_weights != 0)
+        np.add.at(list_weights, (rows[keep], cols[keep]), key_weights[keep])
+
+    animated = dublf_animation.is_animated(obj)
+    ones = np.ones(num_frames)
+
+    for groupIndex in eval_map.groups:
+        blocks = eval_map.list_blocks[groupIndex]
+        group = obj.ska_groups[groupIndex]
+        ska_columns = np.array([ columns.get(block, -1) for block in blocks ], dtype=np.int64)
+        active_index = group.active_index
+        list_weights = np.zeros(shape)
+
+        if not animated:
+            add(list_weights, ska_columns, np.full(num_frames, active_index, dtype=np.int64), ones)
+        else:
+            for fcurve in dublf_animation.get_curves(obj, groups.index_path(groupIndex)):
+                table = cache.get_keyframe_table(fcurve)
+                times = np.asarray(table.times, dtype=np.float64)
+                values = np.asarray(table.values).astype(np.int64)
+                constant = np.asarray(table.constant, dtype=bool)
+                num_keys = len(times)
+
+                # Just one keyframe
+                if num_keys < 2:
+                    current = values[0] if num_keys == 1 else active_index
+                    add(list_weights, ska_columns, np.full(num_frames, current, dtype=np.int64), ones)
+                    continue
+
+                prev_index = np.searchsorted(times, frames, side='right') - 1
+                before = prev_index < 0
+                prev_index = np.maximum(prev_index, 0)
+                next_index = np.minimum(prev_index + 1, num_keys - 1)
+                # before the first key, after the last one, or constant interpolation
+                hold = before | constant[prev_index] | (prev_index == num_keys - 1)
+
+                d = times[next_index] - times[prev_index]
+                ratio = np.where(d == 0, 1.0, (frames - times[prev_index]) / np.where(d == 0, 1.0, d))
+                ratio[hold] = 0.0
+
+                add(list_weights, ska_columns, values[prev_index], 1.0 - ratio)
+                add(list_weights, ska_columns, values[next_index], ratio)
+
+        # The weight of the group, which may be animated
+        group_weight = group.weight
+        if animated:
+            for fcurve in dublf_animation.get_curves(obj, groups.weight_path(groupIndex)):
+                group_weight = np.array([ fcurve.evaluate(frame) for frame in frames ])[:, np.newaxis]
+
+        # Same as Accumulator.end_list
+        list_weights *= group_weight
+        if mode == 'MAX':
+            np.maximum(weights, list_weights, out=weights)
+        else:
+            weights += list_weights
+            if mode == 'MEAN':
+                counts += (list_weights != 0) * group_weight
+
+    # Same as Accumulator.result
+    if mode == 'MEAN':
+        np.divide(weights, counts, out=weights, where=counts > 0)
+    elif mode == 'ADD':
+        np.minimum(weights, 1.0, out=weights)
+    elif mode == 'NORMALIZE':
+        totals = weights.sum(axis=1, keepdims=True)
+        np.divide(weights, totals, out=weights, where=totals > 0)
+    return indices, weights
+
+def write_fcurves(obj, indices, frames, weights):
+    """Writes the weights as fcurves on the values of the shape keys.
+    Keys which are the same as both their neighbours are not written"""
+    global _linear_interpolation
+    if _linear_interpolation is None:
+        _linear_interpolation = bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items['LINEAR'].value
+
+    shape_keys = obj.data.shape_keys
+    anim_data = shape_keys.animation_data
+    if anim_data is None:
+        anim_data = shape_keys.animation_data_create()
+    action = anim_data.action
+    if action is None:
+        action = bpy.data.actions.new(shape_keys.name + 'Action')
+        anim_data.action = action
+
+    frames = np.asarray(frames, dtype=np.float32)
+    key_blocks = shape_keys.key_blocks
+    for c, i in enumerate(indices):
+        data_path = key_blocks[i].path_from_id('value')
+        fcurve = action.fcurves.find(data_path)
+        if fcurve is not None:
+            action.fcurves.remove(fcurve)
+        fcurve = action.fcurves.new(data_path)
+
+        values = weights[:, c]
+        keep = np.ones(len(values), dtype=bool)
+        keep[1:-1] = (values[1:-1] != values[:-2]) | (values[1:-1] != values[2:])
+        num_keys = int(np.count_nonzero(keep))
+
+        co = np.empty((num_keys, 2), dtype=np.float32)
+        co[:, 0] = frames[keep]
+        co[:, 1] = values[keep]
+
+        keyframe_points = fcurve.keyframe_points
+        keyframe_points.add(num_keys)
+        keyframe_points.foreach_set('co', co.ravel())
+        keyframe_points.foreach_set('interpolation', [_linear_interpolation] * num_keys)
+        fcurve.update()
+
+def set_baked(obj, baked):
+    """Sets Object.ska_baked on the object and on the other objects sharing its shape keys,
+    which are animated by the same fcurves"""
+    # The baked objects are not in the registry anymore: all the objects are checked
+    shape_keys = obj.data.shape_keys
+    users = [ obj ]
+    if shape_keys is not None:
+        users.extend(user for user in bpy.data.objects
+            if user != obj and getattr(user.data, 'shape_keys', None) == shape_keys)
+    for user in users:
+        if user.ska_baked != baked:
+            user.ska_baked = baked
+
+def bake(obj, frames, disable_handler=True):
+    """Bakes the SKA animation of the object to its shape keys for the given frames.
+    Returns False if there was nothing to bake"""
+    if not registry.has_ska_keys(obj): return False
+    indices, weights = evaluate_range(obj, frames)
+    if len(indices) == 0: return False
+    write_fcurves(obj, indices, frames, weights)
+    if disable_handler:
+        set_baked(obj, True)
+    return True
+
+def clear_bake(obj):
+    """Removes the baked fcurves of the shape keys managed by DuSKA and re-enables the handler"""
+    eval_map = cache.get_eval_map(obj)
+    if eval_map is not None:
+        shape_keys = obj.data.shape_keys
+        anim_data = shape_keys.animation_data
+        if anim_data is not None and anim_data.action is not None:
+            action = anim_data.action
+            for i in eval_map.managed:
+                fcurve = action.fcurves.find(shape_keys.key_blocks[i].path_from_id('value'))
+                if fcurve is not None:
+                    action.fcurves.remove(fcurve)
+    set_baked(obj, False)
+
+class DUSKA_OT_bake( bpy.types.Operator ):
+    bl_idname = "object.ska_bake"
+    bl_label = "Bake SKA to Shape Key Values"
+    bl_description = "Bakes the animation of the Animated Keys to the values of the Shape Keys, for the frame range of the scene"
+    bl_options = {'REGISTER','UNDO'}
+
+    selected_only: bpy.props.BoolProperty(name="Selected only", default=True)
+    disable_handler: bpy.props.BoolProperty(name="Disable DuSKA on baked objects", default=True,
+        description="DuSKA will not update the baked objects anymore, the add-on is then not needed to play the animation")
+    workers: bpy.props.IntProperty(name="Processes", default=1, min=0,
+        description="Number of Blender processes evaluating the frames in parallel; 0 to use all the CPU cores. Useful for long frame ranges")
+
+    def execute(self, context):
+        scene = context.scene
+        if self.selected_only:
+            objects = context.selected_objects
+        else:
+            objects = registry.objects()
+        # Objects sharing their shape keys are baked once
+        objects = registry.unique_drivers(objects)
+
+        if self.workers != 1:
+            from . import multibake # multibake uses this module
+            try:
+                num_baked = multibake.bake_parallel(objects, scene.frame_start, scene.frame_end, self.workers, self.disable_handler)
+            except RuntimeError as e:
+                self.report({'ERROR'}, str(e))
+                return {'CANCELLED'}
+            self.report({'INFO'}, "Baked " + str(num_baked) + " object(s)")
+            return {'FINISHED'}
+
+        frames = np.arange(scene.frame_start, scene.frame_end + 1, dtype=np.float64)
+        num_baked = 0
+        for obj in objects:
+            if bake(obj, frames, self.disable_handler):
+                num_baked = num_baked + 1
+
+        self.report({'INFO'}, "Baked " + str(num_baked) + " object(s)")
+        return {'FINISHED'}
+
+class DUSKA_OT_clear_bake( bpy.types.Operator ):
+    bl_idname = "object.ska_clear_bake"
+    bl_label = "Clear SKA Bake"
+    bl_description = "Removes the baked animation of the Shape Key values and lets DuSKA animate them again"
+    bl_options = {'REGISTER','UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.object
+        if obj is None: return False
+        return obj.ska_baked
+
+    def execute(self, context):
+        clear_bake(context.object)
+        return {'FINISHED'}
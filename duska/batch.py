@@ -0,0 +1,165 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Edits the SKA groups of several objects at once.
+
+This is the Python API used by the operators, which can be called with any list of objects, e.g. to set up a crowd:
+
+    from duska import batch
+    batch.add_key(bpy.context.selected_objects, groupIndex=0, from_mix=True)
+
+The shape keys belong to the mesh (or curve) data: objects sharing the same data are grouped,
+their shape keys are created or deleted only once, and all of them get the SKA keys.
+Called from a single operator, all the changes are one undo step.
+"""
+
+from .dublf import animation as dublf_animation # pylint: disable=import-error
+from . import registry
+from . import cache
+from . import groups
+
+def by_data(objects):
+    """Groups the objects using the same data. Returns a list of lists of objects, in the order of the objects"""
+    users = {}
+    for obj in objects:
+        if obj is None or (obj.type != 'CURVE' and obj.type != 'MESH'): continue
+        users.setdefault(obj.data.as_pointer(), []).append(obj)
+    return list(users.values())
+
+def _updated(objects):
+    for obj in objects:
+        cache.invalidate(obj)
+        registry.update(obj)
+
+def _delete_shape_keys(obj, names):
+    """Deletes the shape keys of the data of the object, except the basis"""
+    shape_keys = obj.data.shape_keys
+    if shape_keys is None: return
+    key_blocks = shape_keys.key_blocks
+    basis_name = key_blocks[0].name
+    for name in names:
+        if name == basis_name: continue
+        key_block = key_blocks.get(name)
+        if key_block is not None:
+            obj.shape_key_remove(key_block)
+
+def add_key(objects, groupIndex=0, from_mix=False, name='SKA.Key', frame=None):
+    """Creates a new shape key for each data, and adds it at the end of the group of all the objects using it.
+    The basis is created and added to the group too if needed, and the new key is set active.
+    If frame is not None, a keyframe is added on the active index curves which already have keyframes.
+    Returns the list of the objects changed"""
+    changed = []
+    for users in by_data(objects):
+        first = users[0]
+        new_basis = first.data.shape_keys is None or len(first.data.shape_keys.key_blocks) == 0
+        shape_key = first.shape_key_add(name=name, from_mix=from_mix)
+        if new_basis: # if it's the first, it's the basis
+            shape_key.name = 'Basis'
+            shape_key = first.shape_key_add(name=name, from_mix=False)
+        key_blocks = first.data.shape_keys.key_blocks
+        basis_name = key_blocks[0].name
+        key_index = key_blocks.find(shape_key.name)
+
+        for obj in users:
+            group = groups.get_group(obj, groupIndex, create=True)
+            ska_keys = group.keys
+            has_basis = new_basis or any(ska.ska_name == basis_name for ska in ska_keys)
+            if new_basis:
+                ska_keys.add().ska_name = basis_name
+            ska_keys.add().ska_name = shape_key.name
+            ska_index = len(ska_keys) - 1
+            if not has_basis:
+                ska_keys.add().ska_name = basis_name
+            cache.invalidate(obj)
+
+            obj.active_shape_key_index = key_index
+            group.active_index = ska_index
+
+            if frame is not None:
+                for curve in dublf_animation.get_curves(obj, groups.index_path(groups.group_index(group))):
+                    keyframes = curve.keyframe_points
+                    if len(keyframes) > 0:
+                        keyframes.insert(frame, ska_index)
+            changed.append(obj)
+    _updated(changed)
+    return changed
+
+def include_key(objects, groupIndex=0, name=''):
+    """Adds the shape key with the given name (by default the active shape key of each object) to the group.
+    Returns the list of the objects changed"""
+    changed = []
+    for users in by_data(objects):
+        shape_keys = users[0].data.shape_keys
+        if shape_keys is None or len(shape_keys.key_blocks) == 0: continue
+        key_blocks = shape_keys.key_blocks
+        if name != '' and key_blocks.get(name) is None: continue
+        for obj in users:
+            key_name = name
+            if key_name == '':
+                key_name = key_blocks[obj.active_shape_key_index].name
+            groups.get_group(obj, groupIndex, create=True).keys.add().ska_name = key_name
+            changed.append(obj)
+    _updated(changed)
+    return changed
+
+def remove_key(objects, groupIndex=0, delete=False):
+    """Removes the active SKA key of the group, and its keyframes.
+    If delete is True, the shape key is deleted too (unless it's the basis).
+    The group is removed when it's empty. Returns the list of the objects changed"""
+    changed = []
+    for users in by_data(objects):
+        names = set()
+        for obj in users:
+            group = groups.get_group(obj, groupIndex)
+            if group is None: continue
+            ska_keys = group.keys
+            active_index = group.active_index
+            if active_index < 0 or active_index >= len(ska_keys): continue
+
+            # remove all keyframes referencing this ska
+            # and adjust values of other keyframes to continue referencing the right skas
+            groups.remove_index(obj, groupIndex, active_index)
+            names.add(ska_keys[active_index].ska_name)
+            ska_keys.remove(active_index)
+            if len(ska_keys) == 0:
+                groups.remove_group(obj, groupIndex)
+            changed.append(obj)
+        if delete:
+            _delete_shape_keys(users[0], names)
+    _updated(changed)
+    return changed
+
+def delete_all_keys(objects, groupIndex=0, delete=False):
+    """Removes the group and its animation.
+    If delete is True, the shape keys of the group are deleted too (except the basis).
+    Returns the list of the objects changed"""
+    changed = []
+    for users in by_data(objects):
+        names = set()
+        for obj in users:
+            group = groups.get_group(obj, groupIndex)
+            if group is None: continue
+            # the animation of the group is removed with it
+            names.update(ska.ska_name for ska in group.keys)
+            groups.remove_group(obj, groupIndex)
+            changed.append(obj)
+        if delete:
+            _delete_shape_keys(users[0], names)
+    _updated(changed)
+    return changed
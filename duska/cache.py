@@ -0,0 +1,173 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Per-object caches used when evaluating the animation.
+
+The caches are rebuilt lazily, when the generation of the object changes (see tracking.py);
+the operators editing the SKA lists must call invalidate(obj).
+"""
+
+from collections import OrderedDict
+import bpy # pylint: disable=import-error
+
+from . import keyframes
+from . import core
+from . import groups
+from . import tracking
+
+MEMO_SIZE = 8
+# The number of weights remembered by each EvalMap: more when they're prefetched during playback
+memo_size = MEMO_SIZE
+
+def set_prefetch(num_frames):
+    """Makes room for the prefetched frames in the memo of the EvalMaps"""
+    global memo_size
+    memo_size = MEMO_SIZE + max(0, num_frames)
+
+class EvalMap():
+    """Maps the SKA names of an object to the indices of its key_blocks,
+    and remembers the last weights evaluated"""
+
+    def __init__(self, obj, shape_keys):
+        key_blocks = shape_keys.key_blocks
+        self.generation = tracking.generation(obj)
+        self.key_pointer = shape_keys.as_pointer()
+        # the names of the key_blocks, in their order: moving, deleting or adding shape keys
+        # is not reported to the tracking of the object
+        self.block_names = tuple(key_blocks.keys())
+        # key_block name -> index, for all the shape keys
+        self.blocks = { name: i for i, name in enumerate(self.block_names) }
+        # the names of the SKA keys of each group
+        self.list_names = [ [ska.name for ska in group.keys] for group in obj.ska_groups ]
+        # the indices of the groups in use, and the data paths of their active index
+        self.groups = [ i for i, names in enumerate(self.list_names) if len(names) > 0 ]
+        self.index_paths = { groups.index_path(i): i for i in self.groups }
+        self.weight_paths = { groups.weight_path(i): i for i in self.groups }
+        # SKA name -> key_block index, only for the SKA keys which have a corresponding shape key
+        self.indices = {}
+        for names in self.list_names:
+            for name in names:
+                i = self.blocks.get(name)
+                if i is None: continue
+                self.indices[name] = i
+        # the key_block indices of the SKA keys of each group, None if there's no corresponding shape key
+        self.list_blocks = [ [self.indices.get(name) for name in names] for names in self.list_names ]
+        # the key_blocks managed by DuSKA
+        self.managed = frozenset(self.indices.values())
+        # (frame, generation) -> the weights { index: weight } evaluated at this frame, the last used at the end.
+        # Drivers may change the weights of the groups at any time: then nothing is remembered
+        anim_data = obj.animation_data
+        self.memoize = anim_data is None or len(anim_data.drivers) == 0
+        self._memo = OrderedDict()
+        self._list_icons = None
+
+    def list_icons(self, groupIndex):
+        """The icons of the SKA keys of the group in the UI list: the basis, the other shape keys,
+        and the keys without shape key"""
+        if self._list_icons is None:
+            icons = { None: 'ERROR', 0: 'MESH_DATA' }
+            self._list_icons = [ [ icons.get(block, 'SHAPEKEY_DATA') for block in blocks ] for blocks in self.list_blocks ]
+        if groupIndex >= len(self._list_icons): return []
+        return self._list_icons[groupIndex]
+
+    def recall(self, frame):
+        """Returns the weights already evaluated at the frame, None if they're not known"""
+        weights = self._memo.get( (frame, self.generation) )
+        if weights is not None:
+            self._memo.move_to_end( (frame, self.generation) )
+        return weights
+
+    def knows(self, frame):
+        """Checks if the weights at the frame are remembered"""
+        return (frame, self.generation) in self._memo
+
+    def remember(self, frame, weights):
+        """Keeps the weights evaluated at the frame, forgetting the least recently used ones"""
+        if not self.memoize: return
+        memo = self._memo
+        memo[ (frame, self.generation) ] = weights
+        while len(memo) > memo_size:
+            memo.popitem(last=False)
+
+    def is_valid(self, obj, shape_keys):
+        """Checks if the SKA data and the shape keys have not been changed since the map was built"""
+        if tracking.is_dirty(obj, self.generation): return False
+        if shape_keys.as_pointer() != self.key_pointer: return False
+        return tuple(shape_keys.key_blocks.keys()) == self.block_names
+
+write_stats = core.WriteStats()
+
+_eval_maps = {} # { object pointer: EvalMap }
+
+def get_eval_map(obj):
+    """Returns the (cached) EvalMap of the object, or None if it has no shape keys"""
+    shape_keys = obj.data.shape_keys
+    if shape_keys is None: return None
+    ptr = obj.as_pointer()
+    eval_map = _eval_maps.get(ptr)
+    if eval_map is None or not eval_map.is_valid(obj, shape_keys):
+        eval_map = EvalMap(obj, shape_keys)
+        _eval_maps[ptr] = eval_map
+    return eval_map
+
+def invalidate(obj):
+    """Invalidates the caches of the object; they'll be rebuilt the next time they're needed"""
+    tracking.tag(obj)
+    _eval_maps.pop(obj.as_pointer(), None)
+
+_keyframe_tables = {} # { fcurve pointer: KeyframeTable }
+_constant_interpolation = None
+
+def get_keyframe_table(fcurve):
+    """Returns the (cached) KeyframeTable of the fcurve"""
+    global _constant_interpolation
+    keyframe_points = fcurve.keyframe_points
+    num_keys = len(keyframe_points)
+    ptr = fcurve.as_pointer()
+    table = _keyframe_tables.get(ptr)
+    if table is not None and len(table) == num_keys: return table
+
+    if _constant_interpolation is None:
+        _constant_interpolation = bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items['CONSTANT'].value
+    co = [0.0] * (num_keys * 2)
+    keyframe_points.foreach_get('co', co)
+    interpolations = [0] * num_keys
+    keyframe_points.foreach_get('interpolation', interpolations)
+    table = keyframes.from_arrays(co, interpolations, _constant_interpolation)
+    _keyframe_tables[ptr] = table
+    return table
+
+def save_cursors():
+    """Returns the cursors of the keyframe tables, to evaluate other frames without losing them"""
+    return [ (table, table.cursor) for table in _keyframe_tables.values() ]
+
+def restore_cursors(cursors):
+    for table, cursor in cursors:
+        table.cursor = cursor
+
+def invalidate_action(action):
+    """Invalidates the keyframe tables of the fcurves of the action"""
+    for fcurve in action.fcurves:
+        _keyframe_tables.pop(fcurve.as_pointer(), None)
+
+def clear():
+    """Invalidates all the caches, for all objects"""
+    tracking.clear()
+    _eval_maps.clear()
+    _keyframe_tables.clear()
@@ -0,0 +1,187 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""The evaluation of the SKA animation, independent from bpy.
+
+The core works on plain data: the keys of each list (names or key_block indices), the active index,
+and the keyframes of the active index curves (as keyframes.KeyframeTable).
+The Blender side (update_ska_index) only collects this data and writes the resulting weights;
+the stand-in backend (standin.py) does the same with in-memory objects.
+"""
+
+# How the weights of the different lists are combined
+BLEND_MODES = (
+    ('MEAN', "Mean", "Average of the lists using the key"),
+    ('ADD', "Add", "Sum of the lists, clamped to 1"),
+    ('MAX', "Max", "Maximum of the lists"),
+    ('NORMALIZE', "Normalized", "Sum of the lists, normalized so that all the weights add up to 1"),
+)
+
+class SkaList():
+    """The data of a SKA list needed to evaluate it"""
+
+    def __init__(self, keys, active_index=-1, tables=None, weight=1.0):
+        # the keys (names or key_block indices) of the SKA keys, in the order of the list;
+        # None for the SKA keys without shape key
+        self.keys = keys
+        self.active_index = active_index
+        # The KeyframeTables of the active index curves;
+        # None if the object is not animated: the active index is used as is
+        self.tables = tables
+        # the influence of the list when it's blended with the other ones
+        self.weight = weight
+
+    def key_at(self, index):
+        """Returns the key at the index, None if the index is out of the list"""
+        index = int(index)
+        if index < 0 or index >= len(self.keys): return None
+        return self.keys[index]
+
+class WriteStats():
+    """Counts the shape key values written, and the writes skipped because the value didn't change"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.written = 0
+        self.skipped = 0
+        self.skipped_objects = 0 # objects for which nothing had changed at all
+
+class Accumulator():
+    """Accumulates the weights of the keys, list after list, and blends the lists.
+
+    Inside a list, the weights of a key are added (the previous and the next keyframes of an interpolation).
+    The lists are then combined according to the blend mode (see BLEND_MODES)."""
+
+    def __init__(self, mode='MEAN'):
+        self.mode = mode
+        self._weights = {} # { key: blended weight }
+        self._counts = {} # { key: sum of the weights of the lists using the key }, for MEAN
+        self._list = {} # { key: weight } of the current list
+
+    def add(self, key, weight):
+        """Adds the weight of a key to the current list"""
+        if weight == 0 or key is None: return
+        self._list[key] = self._list.get(key, 0.0) + weight
+
+    def end_list(self, list_weight=1.0):
+        """Blends the current list with the previous ones, and starts a new list"""
+        current = self._list
+        if len(current) == 0: return
+        self._list = {}
+        weights = self._weights
+        mode = self.mode
+        if mode == 'MAX':
+            for key, weight in current.items():
+                weight = weight * list_weight
+                if weight > weights.get(key, 0.0): weights[key] = weight
+            return
+        for key, weight in current.items():
+            weights[key] = weights.get(key, 0.0) + weight * list_weight
+        if mode == 'MEAN':
+            counts = self._counts
+            for key in current:
+                counts[key] = counts.get(key, 0.0) + list_weight
+
+    def result(self):
+        """Returns the blended weights { key: weight }"""
+        self.end_list()
+        weights = self._weights
+        mode = self.mode
+        if mode == 'MEAN':
+            counts = self._counts
+            return { key: weight / counts[key] for key, weight in weights.items() if counts[key] != 0 }
+        if mode == 'ADD':
+            return { key: min(weight, 1.0) for key, weight in weights.items() }
+        if mode == 'NORMALIZE':
+            total = sum(weights.values())
+            if total == 0: return {}
+            return { key: weight / total for key, weight in weights.items() }
+        return dict(weights)
+
+def evaluate_list(ska_list, frame, add):
+    """Evaluates one list at the frame, calls add(key, weight) for each key used.
+    When the list is animated, the result only depends on the keyframes, not on the current active index"""
+    # not animated
+    if ska_list.tables is None:
+        add(ska_list.key_at(ska_list.active_index), 1.0)
+        return
+
+    for table in ska_list.tables:
+        num_keys = len(table)
+        if num_keys == 0:
+            add(ska_list.key_at(ska_list.active_index), 1.0)
+            continue
+        # Just one keyframe, or before the first one: the first key is held
+        prev_index = table.previous_index(frame) if num_keys > 1 else -1
+        if prev_index < 0:
+            add(ska_list.key_at(table.values[0]), 1.0)
+            continue
+        prev_key = ska_list.key_at(table.values[prev_index])
+        next_index = prev_index + 1
+        if table.constant[prev_index] or next_index >= num_keys:
+            add(prev_key, 1.0)
+            continue
+        # Interpolate
+        next_key = ska_list.key_at(table.values[next_index])
+        prev_time = table.times[prev_index]
+        d = table.times[next_index] - prev_time
+        if d == 0:
+            ratio = 1.0
+        else:
+            ratio = (frame - prev_time) / d
+        add(prev_key, 1.0 - ratio)
+        add(next_key, ratio)
+
+def evaluate(ska_lists, frame, mode='MEAN'):
+    """Evaluates the SKA lists of an object at the frame.
+    Returns the weights { key: weight } of the keys used at this frame, the lists being blended according to the mode.
+    Returns an empty dict if no list is active"""
+    accumulator = Accumulator(mode)
+    for ska_list in ska_lists:
+        evaluate_list(ska_list, frame, accumulator.add)
+        accumulator.end_list(ska_list.weight)
+    return accumulator.result()
+
+def resolve(weights, managed, indices=None):
+    """Returns the weights of all the managed key_blocks { index: weight }, the ones without weight are set to 0.
+    If the keys of the weights are names, indices maps them to the key_block indices"""
+    result = dict.fromkeys(managed, 0.0)
+    if indices is None:
+        result.update(weights)
+        return result
+    for name, weight in weights.items():
+        i = indices.get(name)
+        if i is None: continue
+        result[i] = weight
+    return result
+
+def changed_weights(applied, weights, stats=None):
+    """Returns the list of (index, weight) which differ from the applied weights { index: weight },
+    and updates applied with them: the caller must write them"""
+    changed = [ (i, weight) for i, weight in weights.items() if applied.get(i) != weight ]
+    for i, weight in changed:
+        applied[i] = weight
+    if stats is not None:
+        stats.written += len(changed)
+        stats.skipped += len(weights) - len(changed)
+        if len(changed) == 0:
+            stats.skipped_objects += 1
+    return changed
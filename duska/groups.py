@@ -0,0 +1,268 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Management of the SKA groups (Object.ska_groups).
+
+The groups are stored in a single collection, and their active index is animated with the
+'ska_groups[N].active_index' data paths. Removing a group changes the data paths of the next ones,
+their fcurves and drivers are updated accordingly.
+Files made with DuSKA 1.2 (ska_keys_N and ska_active_index_N properties) are migrated when they're loaded.
+"""
+
+import re
+import numpy as np
+import bpy # pylint: disable=import-error
+
+NUM_LEGACY_LISTS = 5
+
+_path_re = re.compile(r'^ska_groups\[(\d+)\](.*)$')
+
+def index_path(groupIndex):
+    """The data path of the active index of the group"""
+    return 'ska_groups[' + str(groupIndex) + '].active_index'
+
+def weight_path(groupIndex):
+    """The data path of the weight of the group"""
+    return 'ska_groups[' + str(groupIndex) + '].weight'
+
+def group_index(group):
+    """Returns the index of the group in its object"""
+    path = group.path_from_id()
+    return int(path[path.rindex('[') + 1:-1])
+
+def get_group(obj, groupIndex, create=False):
+    """Returns the group at the index, None if it doesn't exist.
+    If create is True, a new group is added if groupIndex is after the last one"""
+    groups = obj.ska_groups
+    if groupIndex < len(groups): return groups[groupIndex]
+    if not create: return None
+    return groups.add()
+
+def is_used(obj):
+    """Checks if the object has at least one group with keys"""
+    for group in obj.ska_groups:
+        if len(group.keys) > 0: return True
+    return False
+
+def _actions(obj):
+    """The actions animating the object, including its NLA strips"""
+    anim_data = obj.animation_data
+    if anim_data is None: return []
+    actions = []
+    if anim_data.action is not None: actions.append(anim_data.action)
+    for track in anim_data.nla_tracks:
+        for strip in track.strips:
+            if strip.action is not None and not strip.action in actions: actions.append(strip.action)
+    return actions
+
+def _fcurves(obj):
+    """Yields (collection, fcurve) for all the fcurves and drivers of the object.
+    The fcurves of linked actions can't be edited and are skipped"""
+    anim_data = obj.animation_data
+    if anim_data is None: return
+    for action in _actions(obj):
+        if action.library is not None: continue
+        for fcurve in list(action.fcurves):
+            yield action.fcurves, fcurve
+    for fcurve in list(anim_data.drivers):
+        yield anim_data.drivers, fcurve
+
+def remove_group(obj, groupIndex):
+    """Removes the group, its animation, and updates the animation of the next groups"""
+    for fcurves, fcurve in _fcurves(obj):
+        match = _path_re.match(fcurve.data_path)
+        if match is None: continue
+        i = int(match.group(1))
+        if i == groupIndex:
+            fcurves.remove(fcurve)
+        elif i > groupIndex:
+            fcurve.data_path = 'ska_groups[' + str(i - 1) + ']' + match.group(2)
+    obj.ska_groups.remove(groupIndex)
+
+def set_keys(group, names):
+    """Replaces the SKA keys of the group with the names, in a single pass:
+    the existing entries are renamed, and only the extra ones are added or removed, at the end"""
+    keys = group.keys
+    for key, name in zip(keys, names):
+        if key.ska_name != name: key.ska_name = name
+    for name in names[len(keys):]:
+        keys.add().ska_name = name
+    for i in range(len(keys) - 1, len(names) - 1, -1):
+        keys.remove(i)
+
+def _index_curves(obj, groupIndex):
+    """The fcurves animating the active index of the group, with keyframes"""
+    path = index_path(groupIndex)
+    for _, fcurve in _fcurves(obj):
+        if fcurve.data_path == path and len(fcurve.keyframe_points) > 0:
+            yield fcurve
+
+# All the data of the keyframes, to copy them with foreach_get/foreach_set: (attribute, size, dtype)
+_keyframe_attributes = (
+    ('co', 2, np.float32),
+    ('handle_left', 2, np.float32),
+    ('handle_right', 2, np.float32),
+    ('interpolation', 1, np.int32),
+    ('easing', 1, np.int32),
+    ('handle_left_type', 1, np.int32),
+    ('handle_right_type', 1, np.int32),
+    ('type', 1, np.int32),
+    ('back', 1, np.float32),
+    ('amplitude', 1, np.float32),
+    ('period', 1, np.float32),
+    ('select_control_point', 1, bool),
+    ('select_left_handle', 1, bool),
+    ('select_right_handle', 1, bool),
+)
+
+def _keep_keyframes(fcurve, keep):
+    """Removes the keyframes of the fcurve where keep is False.
+    The kept keyframes are moved to the beginning, and the extra ones removed from the end"""
+    keyframe_points = fcurve.keyframe_points
+    num_keys = len(keyframe_points)
+    num_kept = int(np.count_nonzero(keep))
+    if num_kept == num_keys: return
+    for attribute, size, dtype in _keyframe_attributes:
+        values = np.empty(num_keys * size, dtype=dtype)
+        keyframe_points.foreach_get(attribute, values)
+        values = values.reshape(num_keys, size)
+        kept = np.empty_like(values)
+        kept[:num_kept] = values[keep]
+        kept[num_kept:] = values[num_kept:]
+        keyframe_points.foreach_set(attribute, kept.ravel())
+    for _ in range(num_keys - num_kept):
+        keyframe_points.remove(keyframe_points[-1], fast=True)
+
+def remove_index(obj, groupIndex, index):
+    """Removes the keyframes of the active index of the group which use the index,
+    and shifts the next ones so that they still use the same SKA keys"""
+    for fcurve in _index_curves(obj, groupIndex):
+        keyframe_points = fcurve.keyframe_points
+        num_keys = len(keyframe_points)
+        co = np.empty(num_keys * 2, dtype=np.float32)
+        keyframe_points.foreach_get('co', co)
+        indices = np.rint(co[1::2]).astype(np.int64)
+        _keep_keyframes(fcurve, indices != index)
+        # the keyframes after the removed index
+        indices = indices[indices != index]
+        delta = np.where(indices > index, -1.0, 0.0).astype(np.float32)
+        if delta.any():
+            co = np.empty(len(indices) * 2, dtype=np.float32)
+            for attribute in ('co', 'handle_left', 'handle_right'):
+                keyframe_points.foreach_get(attribute, co)
+                co[1::2] += delta
+                keyframe_points.foreach_set(attribute, co)
+        fcurve.update()
+
+def move_index(obj, groupIndex, index, new_index):
+    """Swaps the two indices in the active index of the group and its keyframes"""
+    mapping = np.arange(len(obj.ska_groups[groupIndex].keys))
+    mapping[index] = new_index
+    mapping[new_index] = index
+    remap_indices(obj, groupIndex, mapping)
+
+def remap_indices(obj, groupIndex, mapping):
+    """Changes the active index of the group and the values of its keyframes: the index i becomes mapping[i].
+    Values out of the mapping are kept"""
+    mapping = np.asarray(mapping, dtype=np.float64)
+    num_mapped = len(mapping)
+    group = obj.ska_groups[groupIndex]
+    active_index = group.active_index
+    if 0 <= active_index < num_mapped:
+        # without calling the update callback
+        group['active_index'] = int(mapping[active_index])
+
+    for fcurve in _index_curves(obj, groupIndex):
+        keyframe_points = fcurve.keyframe_points
+        num_keys = len(keyframe_points)
+        co = np.empty(num_keys * 2, dtype=np.float32)
+        keyframe_points.foreach_get('co', co)
+        values = co[1::2]
+        indices = np.rint(values).astype(np.int64)
+        valid = (indices >= 0) & (indices < num_mapped)
+        delta = np.zeros(num_keys, dtype=np.float32)
+        delta[valid] = mapping[indices[valid]] - values[valid]
+        if not delta.any(): continue
+        # The handles are moved with their keyframe
+        for attribute in ('co', 'handle_left', 'handle_right'):
+            keyframe_points.foreach_get(attribute, co)
+            co[1::2] += delta
+            keyframe_points.foreach_set(attribute, co)
+        fcurve.update()
+
+def needs_migration(obj):
+    """Checks if the object still uses the SKA lists of DuSKA 1.2"""
+    if obj.type != 'CURVE' and obj.type != 'MESH': return False
+    for i in range(0, NUM_LEGACY_LISTS):
+        if len(getattr(obj, 'ska_keys_' + str(i))) > 0: return True
+    return False
+
+def can_migrate(obj):
+    """Checks if the lists of DuSKA 1.2 and their animation can be edited: the object is not linked,
+    and its active indices are not animated by a linked action (e.g. a library override)"""
+    if obj.library is not None: return False
+    legacy_paths = { 'ska_active_index_' + str(i) for i in range(0, NUM_LEGACY_LISTS) }
+    for action in _actions(obj):
+        if action.library is None: continue
+        if any(fcurve.data_path in legacy_paths for fcurve in action.fcurves): return False
+    return True
+
+def migrate(obj):
+    """Moves the SKA lists of DuSKA 1.2 to groups, with their animation"""
+    groups = obj.ska_groups
+    paths = {}
+    for i in range(0, NUM_LEGACY_LISTS):
+        legacy_keys = getattr(obj, 'ska_keys_' + str(i))
+        if len(legacy_keys) == 0: continue
+        paths['ska_active_index_' + str(i)] = index_path(len(groups))
+        group = groups.add()
+        for legacy_key in legacy_keys:
+            group.keys.add().ska_name = legacy_key.ska_name
+        group['active_index'] = getattr(obj, 'ska_active_index_' + str(i))
+        legacy_keys.clear()
+
+    for fcurves, fcurve in _fcurves(obj):
+        path = paths.get(fcurve.data_path)
+        if path is not None:
+            fcurve.data_path = path
+
+# The names of the objects using DuSKA 1.2 which couldn't be migrated, and are not animated by DuSKA
+unmigrated = []
+
+def migrate_all():
+    """Migrates all the objects of the file which need it. Returns the number of objects migrated.
+    The objects which can't be migrated are listed in unmigrated"""
+    num_migrated = 0
+    unmigrated.clear()
+    for obj in bpy.data.objects:
+        if not needs_migration(obj): continue
+        if not can_migrate(obj):
+            unmigrated.append(obj.name_full)
+            continue
+        try:
+            migrate(obj)
+        except (AttributeError, RuntimeError, TypeError) as e:
+            print("DuSKA: can't migrate " + obj.name_full + ": " + str(e))
+            unmigrated.append(obj.name_full)
+            continue
+        num_migrated = num_migrated + 1
+    if len(unmigrated) > 0:
+        print("DuSKA: " + str(len(unmigrated)) + " object(s) made with DuSKA 1.2 can't be migrated because they're linked, "
+            "open and save their library with this version: " + ", ".join(unmigrated))
+    return num_migrated
@@ -0,0 +1,194 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Finds the SKA keys whose shape key has been renamed or deleted outside of DuSKA, and repairs them.
+
+All the objects of the file are checked in one pass when it's loaded, with a set of the key_block names
+of each shape keys datablock. The index of the key_block of each SKA key is recorded when the file is saved
+(DUSKA_key.block_index), with the number of key_blocks: a broken key can be relinked to the key_block at this index
+if the shape keys have only been renamed (their number hasn't changed: when one is deleted, the next ones move)
+and if it's not used by another key of the object. The other broken keys can be removed with their keyframes.
+"""
+
+import bpy # pylint: disable=import-error
+
+from . import registry
+from . import cache
+from . import groups
+
+class Report():
+    """The result of scan()"""
+
+    def __init__(self):
+        self.num_objects = 0
+        self.num_keys = 0
+        # { object name: [ (groupIndex, keyIndex) ] }
+        self.broken = {}
+
+    @property
+    def num_broken(self):
+        return sum(len(keys) for keys in self.broken.values())
+
+    def message(self):
+        return (str(self.num_broken) + " broken Animated Key(s) in " + str(len(self.broken)) + " object(s), " +
+            str(self.num_keys) + " keys checked in " + str(self.num_objects) + " objects")
+
+NUM_BLOCKS_PROPERTY = '_duska_num_blocks' # on the Key, when the indices are recorded
+
+# The report of the last scan
+report = Report()
+
+def _key_names(obj, names):
+    """Returns the set of the key_block names of the object, shared by the objects using the same shape keys"""
+    shape_keys = obj.data.shape_keys
+    if shape_keys is None: return frozenset()
+    ptr = shape_keys.as_pointer()
+    result = names.get(ptr)
+    if result is None:
+        result = frozenset(shape_keys.key_blocks.keys())
+        names[ptr] = result
+    return result
+
+def _objects():
+    for obj in bpy.data.objects:
+        if obj.library is not None: continue
+        if obj.type != 'CURVE' and obj.type != 'MESH': continue
+        if not groups.is_used(obj): continue
+        yield obj
+
+def scan():
+    """Checks the SKA keys of all the objects of the file. Returns a Report, which is kept as the last report"""
+    global report
+    result = Report()
+    names = {} # { shape keys pointer: key_block names }
+    for obj in _objects():
+        key_names = _key_names(obj, names)
+        result.num_objects = result.num_objects + 1
+        broken = []
+        for groupIndex, group in enumerate(obj.ska_groups):
+            for keyIndex, ska in enumerate(group.keys):
+                if not ska.ska_name in key_names:
+                    broken.append( (groupIndex, keyIndex) )
+            result.num_keys = result.num_keys + len(group.keys)
+        if len(broken) > 0:
+            result.broken[obj.name] = broken
+    report = result
+    return result
+
+def record_indices():
+    """Stores the index of the key_block of each SKA key, to relink them if the shape keys are renamed"""
+    for obj in _objects():
+        shape_keys = obj.data.shape_keys
+        if shape_keys is None: continue
+        key_blocks = shape_keys.key_blocks
+        if shape_keys.library is None and shape_keys.get(NUM_BLOCKS_PROPERTY) != len(key_blocks):
+            shape_keys[NUM_BLOCKS_PROPERTY] = len(key_blocks)
+        for group in obj.ska_groups:
+            for ska in group.keys:
+                i = key_blocks.find(ska.ska_name)
+                if i >= 0 and ska.block_index != i:
+                    ska.block_index = i
+
+def _relink(obj, broken):
+    """Relinks the broken keys to the key_block at their last index when it's not used. Returns the keys still broken.
+    A shape key is used in several groups (e.g. the basis): all the keys with the same old name are relinked together"""
+    shape_keys = obj.data.shape_keys
+    if shape_keys is None: return broken
+    key_blocks = shape_keys.key_blocks
+    # Shape keys have been added or deleted: the indices don't match anymore
+    if shape_keys.get(NUM_BLOCKS_PROPERTY) != len(key_blocks): return broken
+    broken_keys = set(broken)
+    used = { ska.ska_name for groupIndex, group in enumerate(obj.ska_groups)
+        for keyIndex, ska in enumerate(group.keys) if not (groupIndex, keyIndex) in broken_keys }
+    relinked = {} # { old name: new name, None if it can't be relinked }
+    remaining = []
+    for groupIndex, keyIndex in broken:
+        ska = obj.ska_groups[groupIndex].keys[keyIndex]
+        old_name = ska.ska_name
+        if not old_name in relinked:
+            i = ska.block_index
+            new_name = key_blocks[i].name if 0 <= i < len(key_blocks) else None
+            # used by a valid key, or by keys which were linked to another shape key
+            if new_name in used or new_name in relinked.values():
+                new_name = None
+            relinked[old_name] = new_name
+        new_name = relinked[old_name]
+        if new_name is None:
+            remaining.append( (groupIndex, keyIndex) )
+            continue
+        ska.ska_name = new_name
+    return remaining
+
+def _prune(obj, broken):
+    """Removes the broken keys and their keyframes"""
+    # The active indices, which must point to the same keys
+    active = {}
+    for groupIndex, keyIndex in broken:
+        group = obj.ska_groups[groupIndex]
+        active.setdefault(groupIndex, group.active_index)
+    # From the end, so that the indices of the next keys don't change
+    for groupIndex, keyIndex in sorted(broken, reverse=True):
+        group = obj.ska_groups[groupIndex]
+        groups.remove_index(obj, groupIndex, keyIndex)
+        group.keys.remove(keyIndex)
+        if keyIndex < active[groupIndex]:
+            active[groupIndex] = active[groupIndex] - 1
+    for groupIndex, active_index in active.items():
+        group = obj.ska_groups[groupIndex]
+        # like remap_indices, the preview is not updated
+        group['active_index'] = min(active_index, len(group.keys) - 1)
+    for groupIndex in sorted({ groupIndex for groupIndex, _ in broken }, reverse=True):
+        if len(obj.ska_groups[groupIndex].keys) == 0:
+            groups.remove_group(obj, groupIndex)
+
+def repair(relink=True, prune=True):
+    """Scans the file and repairs the broken keys. Returns the number of keys relinked and removed"""
+    num_relinked = 0
+    num_removed = 0
+    for name, broken in scan().broken.items():
+        obj = bpy.data.objects.get(name)
+        if obj is None: continue
+        num_broken = len(broken)
+        if relink:
+            broken = _relink(obj, broken)
+            num_relinked = num_relinked + num_broken - len(broken)
+        if prune and len(broken) > 0:
+            _prune(obj, broken)
+            num_removed = num_removed + len(broken)
+        cache.invalidate(obj)
+        registry.update(obj)
+    record_indices()
+    scan()
+    return num_relinked, num_removed
+
+class DUSKA_OT_repair_keys( bpy.types.Operator ):
+    bl_idname = "object.ska_repair_keys"
+    bl_label = "Repair Animated Keys"
+    bl_description = "Repairs the Animated Keys of all the objects whose Shape Key has been renamed or deleted"
+    bl_options = {'REGISTER','UNDO'}
+
+    relink: bpy.props.BoolProperty(name="Relink", default=True,
+        description="Relinks the keys to the Shape Key at the same index, when it's not used by another key")
+    prune: bpy.props.BoolProperty(name="Remove", default=True,
+        description="Removes the keys which can't be relinked, and their keyframes")
+
+    def execute(self, context):
+        num_relinked, num_removed = repair(self.relink, self.prune)
+        self.report({'INFO'}, str(num_relinked) + " Animated Key(s) relinked, " + str(num_removed) + " removed; " + report.message())
+        return {'FINISHED'}
@@ -0,0 +1,74 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Fast keyframe lookup, independent from bpy."""
+
+from bisect import bisect_right
+
+class KeyframeTable():
+    """The sorted times, values and interpolations of the keyframes of an fcurve.
+
+    Finds the keyframes around a frame with a binary search,
+    and in constant time during sequential playback thanks to a cursor on the last segment found.
+    """
+
+    def __init__(self, times, values, constant):
+        self.times = times # sorted frames
+        self.values = values
+        self.constant = constant # True if the interpolation of the key is 'CONSTANT'
+        self.cursor = -1 # the index of the last segment found
+
+    def __len__(self):
+        return len(self.times)
+
+    def previous_index(self, frame):
+        """Returns the index of the last key at or before the frame, -1 if there's none.
+        The next key, if any, is at previous_index + 1"""
+        times = self.times
+        n = len(times)
+        if n == 0 or frame < times[0]:
+            self.cursor = -1
+            return -1
+
+        # Try the current and next segments first
+        i = self.cursor
+        if i >= 0 and times[i] <= frame:
+            if i + 1 == n or frame < times[i+1]:
+                return i
+            if i + 2 == n or frame < times[i+2]:
+                self.cursor = i + 1
+                return i + 1
+
+        i = bisect_right(times, frame) - 1
+        self.cursor = i
+        return i
+
+def from_arrays(co, interpolations, constant_value):
+    """Creates a KeyframeTable from the flat co array (time, value, time, value...)
+    and the interpolations of the keyframes, as read with foreach_get"""
+    times = co[0::2]
+    values = co[1::2]
+    constant = [ipo == constant_value for ipo in interpolations]
+    # keyframe_points are normally sorted, but make sure
+    if any(times[i] > times[i+1] for i in range(len(times) - 1)):
+        order = sorted(range(len(times)), key=times.__getitem__)
+        times = [times[i] for i in order]
+        values = [values[i] for i in order]
+        constant = [constant[i] for i in order]
+    return KeyframeTable(times, values, constant)
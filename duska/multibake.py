@@ -0,0 +1,185 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Bakes the SKA animation with several Blender processes.
+
+The frame range is split in contiguous chunks, one per worker. Each worker runs `blender --background`
+on a copy of the file, evaluates its chunk with bake.evaluate_range and saves the weights to a .npz file.
+The master then concatenates the chunks and writes the fcurves with bake.write_fcurves,
+so the result is exactly the same as a bake in a single process.
+
+Headless, on a saved file:
+    blender --background shot.blend --python-expr "import duska.multibake as m; m.main()" -- --workers 8
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+import subprocess
+import numpy as np
+import bpy # pylint: disable=import-error
+
+from . import registry
+from . import bake
+
+_package = __package__
+
+WORKER_EXPR = ("import addon_utils, importlib; addon_utils.enable('{package}', default_set=False); "
+    "importlib.import_module('{package}.multibake').worker_main()")
+
+def default_workers():
+    """The number of workers used by default: one per CPU core"""
+    return max(1, os.cpu_count() or 1)
+
+def split_range(frame_start, frame_end, num_chunks):
+    """Splits the frame range (included) in at most num_chunks contiguous chunks of the same size.
+    Returns a list of (start, end), empty if the range is empty"""
+    num_frames = frame_end - frame_start + 1
+    if num_frames <= 0: return []
+    num_chunks = max(1, min(num_chunks, num_frames))
+    chunks = []
+    start = frame_start
+    for c in range(num_chunks):
+        size = num_frames // num_chunks + (1 if c < num_frames % num_chunks else 0)
+        chunks.append( (start, start + size - 1) )
+        start = start + size
+    return chunks
+
+def _arguments():
+    argv = sys.argv
+    if '--' in argv: return argv[argv.index('--') + 1:]
+    return []
+
+def worker_main():
+    """Entry point of a worker: evaluates a chunk of frames and saves the weights"""
+    parser = argparse.ArgumentParser(description="DuSKA bake worker")
+    parser.add_argument('--objects', required=True, help="JSON file containing the names of the objects to bake")
+    parser.add_argument('--start', type=int, required=True)
+    parser.add_argument('--end', type=int, required=True)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args(_arguments())
+
+    with open(args.objects) as f:
+        names = json.load(f)
+
+    frames = np.arange(args.start, args.end + 1, dtype=np.float64)
+    # The same name can be used by objects of different libraries
+    objects = { obj.name_full: obj for obj in bpy.data.objects }
+    arrays = {}
+    for n, name in enumerate(names):
+        obj = objects.get(name)
+        if obj is None or not registry.has_ska_keys(obj): continue
+        indices, weights = bake.evaluate_range(obj, frames)
+        if len(indices) == 0: continue
+        arrays['indices_' + str(n)] = np.asarray(indices, dtype=np.int64)
+        arrays['weights_' + str(n)] = weights
+    # Written to a temporary name first, so that an incomplete file is never read
+    with open(args.output + '.part', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(args.output + '.part', args.output)
+
+def run_workers(filepath, names, chunks, directory):
+    """Runs one worker per chunk on the file, and waits for all of them.
+    Returns the paths of the chunk files, in the order of the chunks"""
+    objects_path = os.path.join(directory, 'objects.json')
+    with open(objects_path, 'w') as f:
+        json.dump(names, f)
+
+    expr = WORKER_EXPR.format(package=_package)
+    processes = []
+    outputs = []
+    for c, (start, end) in enumerate(chunks):
+        output = os.path.join(directory, 'chunk_' + str(c) + '.npz')
+        command = [bpy.app.binary_path, '--background', filepath, '--python-expr', expr, '--',
+            '--objects', objects_path, '--start', str(start), '--end', str(end), '--output', output]
+        processes.append( subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) )
+        outputs.append(output)
+
+    errors = []
+    for c, process in enumerate(processes):
+        _, stderr = process.communicate()
+        if process.returncode != 0 or not os.path.isfile(outputs[c]):
+            errors.append("Chunk " + str(c) + ": " + stderr.decode(errors='replace').strip()[-500:])
+    if len(errors) > 0:
+        raise RuntimeError("DuSKA bake workers failed\n" + "\n".join(errors))
+    return outputs
+
+def merge(names, outputs):
+    """Concatenates the chunks of each object. Returns { name: (indices, weights) }"""
+    chunks = [ np.load(output) for output in outputs ]
+    result = {}
+    for n, name in enumerate(names):
+        key = 'weights_' + str(n)
+        if not key in chunks[0]: continue
+        indices = [ int(i) for i in chunks[0]['indices_' + str(n)] ]
+        result[name] = (indices, np.concatenate([ chunk[key] for chunk in chunks ]))
+    for chunk in chunks:
+        chunk.close()
+    return result
+
+def bake_parallel(objects, frame_start, frame_end, num_workers=0, disable_handler=True):
+    """Bakes the objects for the frame range (included), with num_workers processes (0: one per CPU core).
+    Returns the number of objects baked"""
+    objects = [ obj for obj in objects if obj.library is None and registry.has_ska_keys(obj) ]
+    if len(objects) == 0 or frame_end < frame_start: return 0
+    if num_workers <= 0: num_workers = default_workers()
+    names = [ obj.name_full for obj in objects ]
+    chunks = split_range(frame_start, frame_end, num_workers)
+
+    directory = tempfile.mkdtemp(prefix='duska_bake_')
+    try:
+        # The workers read a copy of the current state of the file, saved or not
+        filepath = os.path.join(directory, 'bake.blend')
+        bpy.ops.wm.save_as_mainfile(filepath=filepath, copy=True, check_existing=False)
+        outputs = run_workers(filepath, names, chunks, directory)
+        baked = merge(names, outputs)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    frames = np.arange(frame_start, frame_end + 1, dtype=np.float64)
+    for obj in objects:
+        data = baked.get(obj.name_full)
+        if data is None: continue
+        bake.write_fcurves(obj, data[0], frames, data[1])
+        if disable_handler:
+            bake.set_baked(obj, True)
+    return len(baked)
+
+def main():
+    """Headless bake of all the objects of the file, which is then saved"""
+    parser = argparse.ArgumentParser(description="Bakes the SKA animation of the file with several processes")
+    parser.add_argument('--workers', type=int, default=0, help="Number of processes (default: one per CPU core)")
+    parser.add_argument('--start', type=int, default=None, help="First frame (default: start of the scene)")
+    parser.add_argument('--end', type=int, default=None, help="Last frame (default: end of the scene)")
+    parser.add_argument('--keep-handler', action='store_true', help="Don't disable DuSKA on the baked objects")
+    parser.add_argument('--output', default='', help="Saves the result to this file instead of the current one")
+    args = parser.parse_args(_arguments())
+
+    import addon_utils # pylint: disable=import-error
+    addon_utils.enable(_package, default_set=False)
+
+    scene = bpy.context.scene
+    start = scene.frame_start if args.start is None else args.start
+    end = scene.frame_end if args.end is None else args.end
+    num_baked = bake_parallel(registry.drivers(), start, end, args.workers, not args.keep_handler)
+    print("DuSKA: baked " + str(num_baked) + " object(s), frames " + str(start) + " to " + str(end))
+    bpy.ops.wm.save_as_mainfile(filepath=args.output or bpy.data.filepath)
@@ -0,0 +1,267 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Native evaluation: the SKA animation of an object compiled to drivers on the values of its shape keys.
+
+With Object.ska_native, the weights of the managed key_blocks are evaluated with bake.evaluate_range
+at the keyframes of the active index curves, and stored as the keyframes of a driver on the value of each key_block.
+The expression of the drivers only reads the frame, which Blender evaluates without Python,
+and their F-Curve maps it to the weight: the shape keys are then evaluated by the depsgraph, on several threads,
+and the frame handler skips the object.
+
+Between two keyframes, the weights are linear or constant, unless the groups are blended in a non linear way.
+Each segment is checked in its middle and at its end: the objects which can't be compiled exactly
+(animated group weights, drivers, NLA, crossing weights with MAX or NORMALIZE...) are still evaluated by the handler.
+The drivers are compiled again from a timer, outside of the depsgraph evaluation, as soon as the object
+is tagged as changed (see tracking.py), so that the drivers don't override the preview of the edits.
+A hash of the animation is stored with the drivers: they're kept when the file is loaded again, if it still matches.
+"""
+
+import numpy as np
+import bpy # pylint: disable=import-error
+
+from .dublf import animation as dublf_animation # pylint: disable=import-error
+from . import registry
+from . import cache
+from . import groups
+from . import bake
+from . import tracking
+from . import weightcache
+
+PROPERTY = '_duska_native' # on the Key: the names of the key_blocks driven by DuSKA
+HASH_PROPERTY = '_duska_native_hash' # on the Key: the hash of the animation compiled to the drivers
+EXPRESSION = 'frame'
+TOLERANCE = 1e-5
+# the end of a segment is checked this far before the next keyframe
+END_OFFSET = 1e-3
+
+_states = {} # { object pointer: (object, EvalMap, True if compiled) }
+_pending = {} # { object pointer: object } to compile from the timer
+_interpolations = None
+
+def _animation_frames(obj, eval_map):
+    """Returns the sorted frames of the keyframes of the active index curves,
+    None if the animation can't be compiled"""
+    anim_data = obj.animation_data
+    if anim_data is None: return []
+    if len(anim_data.nla_tracks) > 0: return None
+    frames = set()
+    for i in eval_map.groups:
+        if len(list(dublf_animation.get_curves(obj, groups.weight_path(i)))) > 0: return None
+        for fcurve in dublf_animation.get_curves(obj, groups.index_path(i)):
+            frames.update(cache.get_keyframe_table(fcurve).times)
+    return sorted(frames)
+
+def _user_drivers(shape_keys):
+    """The data paths of the drivers of the shape keys which have not been added by DuSKA"""
+    anim_data = shape_keys.animation_data
+    if anim_data is None: return set()
+    ours = { shape_keys.key_blocks[name].path_from_id('value')
+        for name in shape_keys.get(PROPERTY, ()) if name in shape_keys.key_blocks }
+    return { fcurve.data_path for fcurve in anim_data.drivers } - ours
+
+def compile_weights(obj, eval_map):
+    """Evaluates the weights of the object as keyframes.
+    Returns the key_block indices, the frames, the weights (frames, indices) and whether each segment is constant,
+    None if the animation can't be expressed with linear and constant segments"""
+    if not eval_map.memoize or len(eval_map.managed) == 0: return None
+    frames = _animation_frames(obj, eval_map)
+    if frames is None: return None
+    if len(frames) == 0: frames = [0.0]
+
+    # The keyframes, then the middle and the end of each segment
+    frames = np.asarray(frames, dtype=np.float64)
+    starts = frames[:-1]
+    lengths = np.diff(frames)
+    offsets = np.minimum(END_OFFSET, lengths / 4)
+    num_frames = len(frames)
+    samples = np.concatenate([frames, starts + lengths / 2, frames[1:] - offsets])
+    indices, weights = bake.evaluate_range(obj, samples)
+    if len(indices) == 0: return None
+
+    keys = weights[:num_frames]
+    middles = weights[num_frames:2 * num_frames - 1]
+    ends = weights[2 * num_frames - 1:]
+    first, last = keys[:-1], keys[1:]
+    end_ratios = ((lengths - offsets) / np.where(lengths == 0, 1.0, lengths))[:, np.newaxis]
+    linear = (np.abs(middles - (first + last) / 2) <= TOLERANCE) & (np.abs(ends - (first + (last - first) * end_ratios)) <= TOLERANCE)
+    flat = (np.abs(middles - first) <= TOLERANCE) & (np.abs(ends - first) <= TOLERANCE)
+    if not np.all(linear | flat): return None
+    return indices, frames, keys, flat & ~linear
+
+def _interpolation_values():
+    global _interpolations
+    if _interpolations is None:
+        items = bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items
+        _interpolations = (items['LINEAR'].value, items['CONSTANT'].value)
+    return _interpolations
+
+def _add_driver(key_block, frames, weights, constant):
+    linear_value, constant_value = _interpolation_values()
+    key_block.driver_remove('value')
+    fcurve = key_block.driver_add('value')
+    fcurve.driver.type = 'SCRIPTED'
+    fcurve.driver.expression = EXPRESSION
+    # New drivers have a generator modifier, the keyframes map the frame to the weight instead
+    for modifier in list(fcurve.modifiers):
+        fcurve.modifiers.remove(modifier)
+
+    num_keys = len(frames)
+    co = np.empty((num_keys, 2), dtype=np.float32)
+    co[:, 0] = frames
+    co[:, 1] = weights
+    interpolations = np.full(num_keys, linear_value, dtype=np.int32)
+    interpolations[:-1][constant] = constant_value
+    keyframe_points = fcurve.keyframe_points
+    keyframe_points.add(num_keys)
+    keyframe_points.foreach_set('co', co.ravel())
+    keyframe_points.foreach_set('interpolation', interpolations)
+    fcurve.extrapolation = 'CONSTANT'
+    fcurve.update()
+
+def remove(obj):
+    """Removes the drivers added by DuSKA to the shape keys of the object"""
+    shape_keys = obj.data.shape_keys
+    if shape_keys is None or not PROPERTY in shape_keys: return
+    key_blocks = shape_keys.key_blocks
+    for name in shape_keys[PROPERTY]:
+        key_block = key_blocks.get(name)
+        if key_block is not None:
+            key_block.driver_remove('value')
+    del shape_keys[PROPERTY]
+    if HASH_PROPERTY in shape_keys:
+        del shape_keys[HASH_PROPERTY]
+
+def _can_compile(obj, shape_keys):
+    if not obj.ska_native or obj.ska_baked: return False
+    return obj.library is None and shape_keys is not None and shape_keys.library is None
+
+def _animation_hash(obj, eval_map):
+    """The hash of the inputs of compile_weights, None if they can't be hashed"""
+    key = weightcache.animation_hash(obj, eval_map)
+    if key is None: return None
+    anim_data = obj.animation_data
+    num_tracks = 0 if anim_data is None else len(anim_data.nla_tracks)
+    return key + ':' + str(eval_map.memoize) + ':' + str(num_tracks)
+
+def _is_up_to_date(shape_keys, key):
+    """Checks if the drivers have been compiled from the same animation and are still there"""
+    if key is None or shape_keys.get(HASH_PROPERTY) != key or not PROPERTY in shape_keys: return False
+    anim_data = shape_keys.animation_data
+    if anim_data is None: return False
+    key_blocks = shape_keys.key_blocks
+    for name in shape_keys[PROPERTY]:
+        key_block = key_blocks.get(name)
+        if key_block is None or anim_data.drivers.find(key_block.path_from_id('value')) is None: return False
+    return True
+
+def update(obj):
+    """Compiles the drivers of the object, or removes them if it can't be compiled.
+    Returns True if the object is evaluated natively"""
+    # The shape keys shared by several objects are compiled from the object animating them
+    driver = registry.driver_of(obj)
+    if driver is not None and driver != obj: return False
+    shape_keys = obj.data.shape_keys
+    eval_map = cache.get_eval_map(obj)
+    compiled = None
+    key = None
+    if eval_map is not None and _can_compile(obj, shape_keys):
+        key = _animation_hash(obj, eval_map)
+        if _is_up_to_date(shape_keys, key):
+            _states[obj.as_pointer()] = (obj, eval_map, True)
+            return True
+        compiled = compile_weights(obj, eval_map)
+    if compiled is not None:
+        indices = compiled[0]
+        key_blocks = shape_keys.key_blocks
+        paths = { key_blocks[i].path_from_id('value') for i in indices }
+        if len(paths & _user_drivers(shape_keys)) > 0: compiled = None
+
+    remove(obj)
+    if compiled is not None:
+        indices, frames, weights, constant = compiled
+        for c, i in enumerate(indices):
+            _add_driver(key_blocks[i], frames, weights[:, c], constant[:, c])
+        shape_keys[PROPERTY] = [ key_blocks[i].name for i in indices ]
+        if key is not None:
+            shape_keys[HASH_PROPERTY] = key
+    _states[obj.as_pointer()] = (obj, eval_map, compiled is not None)
+    return compiled is not None
+
+def compile_timer():
+    objects = list(_pending.values())
+    _pending.clear()
+    for obj in objects:
+        try:
+            update(obj)
+        except ReferenceError: # removed in the meantime
+            pass
+    return None
+
+def schedule(obj):
+    """Compiles the object from a timer, as soon as possible"""
+    _pending[obj.as_pointer()] = obj
+    if not bpy.app.timers.is_registered(compile_timer):
+        bpy.app.timers.register(compile_timer, first_interval=0.0)
+
+def is_native(obj, eval_map):
+    """Checks if the shape keys of the object are evaluated by its drivers.
+    If the object has changed since it was compiled, it's compiled again by a timer
+    and evaluated by the handler in the meantime"""
+    state = _states.get(obj.as_pointer())
+    if state is None or state[1] is not eval_map:
+        schedule(obj)
+        return False
+    return state[2]
+
+def is_compiled(obj):
+    """Checks if the object has been compiled to drivers the last time it was updated"""
+    state = _states.get(obj.as_pointer())
+    return state is not None and state[2]
+
+def _tagged(ptr):
+    """Compiles again the objects already compiled (or checked) when they change"""
+    state = _states.get(ptr)
+    if state is None: return
+    try:
+        schedule(state[0])
+    except ReferenceError:
+        _states.pop(ptr, None)
+
+def schedule_all(objects):
+    """Compiles the objects using the native evaluation"""
+    for obj in objects:
+        if obj.ska_native:
+            schedule(obj)
+
+def register():
+    if not _tagged in tracking.listeners:
+        tracking.listeners.append(_tagged)
+
+def clear():
+    """The objects will be compiled again the next time they're evaluated"""
+    _states.clear()
+    _pending.clear()
+
+def unregister():
+    if _tagged in tracking.listeners:
+        tracking.listeners.remove(_tagged)
+    if bpy.app.timers.is_registered(compile_timer):
+        bpy.app.timers.unregister(compile_timer)
+    clear()
@@ -0,0 +1,209 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Finds the shape keys of a mesh which are the same as the basis or as another key, and merges them.
+
+All the coordinates are read at once with foreach_get. Two keys are duplicates if the distance
+between their vertices is always below the tolerance. To avoid comparing all the pairs,
+a key is only compared to the ones with a close mean offset from the basis: if all the vertices
+are closer than the tolerance, the mean offsets are too.
+
+Merging a duplicate changes the SKA keys using it, in all the objects sharing the mesh, to use the kept key,
+and remaps the keyframes of the active indices, so the animation doesn't change.
+A duplicate is merged only if it and the kept key are not used by different groups of the same object:
+the groups would then blend their weights instead of adding the two shapes.
+Keys which are the same as the basis have no effect, they can always be merged into it.
+"""
+
+import numpy as np
+import bpy # pylint: disable=import-error
+
+from . import registry
+from . import cache
+from . import groups
+
+class Analysis():
+    """The result of analyze()"""
+
+    def __init__(self, num_keys, key_size):
+        self.num_keys = num_keys
+        # the memory used by each shape key, in bytes
+        self.key_size = key_size
+        # key_block name -> the name of the key it duplicates (the basis or a previous key)
+        self.duplicates = {}
+        # the duplicates which can be merged safely
+        self.mergeable = {}
+        self.basis = ''
+
+    @property
+    def memory(self):
+        return self.num_keys * self.key_size
+
+    @property
+    def basis_like(self):
+        return [ name for name, original in self.duplicates.items() if original == self.basis ]
+
+def key_coordinates(key_blocks):
+    """Returns the coordinates of all the key_blocks, as an array (num_blocks, num_vertices, 3)"""
+    num_vertices = len(key_blocks[0].data)
+    coords = np.empty((len(key_blocks), num_vertices * 3), dtype=np.float32)
+    for b, key_block in enumerate(key_blocks):
+        key_block.data.foreach_get('co', coords[b])
+    return coords.reshape(len(key_blocks), num_vertices, 3)
+
+def users(mesh):
+    """The objects using the mesh"""
+    return [ obj for obj in bpy.data.objects if obj.data == mesh ]
+
+def _is_plain(key_block, reference):
+    return key_block.vertex_group == '' and key_block.relative_key == reference
+
+def analyze(obj, tolerance):
+    """Finds the duplicate shape keys of the object. Returns an Analysis, None if there are no shape keys"""
+    shape_keys = obj.data.shape_keys
+    if shape_keys is None or len(shape_keys.key_blocks) == 0: return None
+    key_blocks = shape_keys.key_blocks
+    reference = shape_keys.reference_key
+    coords = key_coordinates(key_blocks)
+    num_keys, num_vertices = coords.shape[0], coords.shape[1]
+    analysis = Analysis(num_keys, num_vertices * 3 * 4)
+    analysis.basis = reference.name
+
+    offsets = coords - coords[key_blocks.find(reference.name)]
+    signatures = offsets.mean(axis=1)
+
+    # The basis is compared first, so that its duplicates are reported as such
+    order = [ key_blocks.find(reference.name) ] + [ b for b in range(num_keys) if key_blocks[b] != reference ]
+    kept = [] # the indices of the keys which are not duplicates
+    for b in order:
+        original = -1
+        if len(kept) > 0:
+            distances = np.linalg.norm(signatures[kept] - signatures[b], axis=1)
+            for k in np.flatnonzero(distances <= tolerance):
+                candidate = kept[k]
+                if np.linalg.norm(coords[b] - coords[candidate], axis=1).max() <= tolerance:
+                    original = candidate
+                    break
+        if original < 0:
+            kept.append(b)
+        else:
+            analysis.duplicates[key_blocks[b].name] = key_blocks[original].name
+
+    # Only the keys used by DuSKA alone can be merged, into the basis or another key used by DuSKA
+    managed = set()
+    user_groups = [] # the names used by each group of each user
+    for user in users(obj.data):
+        eval_map = cache.get_eval_map(user)
+        if eval_map is None: continue
+        managed.update(eval_map.indices)
+        user_groups.append([ set(names) for names in eval_map.list_names ])
+    relatives = { key_block.relative_key.name for key_block in key_blocks if key_block != reference }
+    for name, original in analysis.duplicates.items():
+        if not name in managed or name in relatives: continue
+        if not _is_plain(key_blocks[name], reference): continue
+        if original != reference.name:
+            if not (original in managed and _is_plain(key_blocks[original], reference)): continue
+            # Blending two groups using the same key is not the same as blending two keys:
+            # both keys must be used by a single group of each object
+            if any(sum(1 for names in group_names if name in names or original in names) > 1 for group_names in user_groups): continue
+        analysis.mergeable[name] = original
+    return analysis
+
+def _merge_group(obj, groupIndex, duplicates):
+    group = obj.ska_groups[groupIndex]
+    keys = group.keys
+    names = [ duplicates.get(key.ska_name, key.ska_name) for key in keys ]
+    # The first key using each name is kept, the others are removed
+    first = {}
+    mapping = []
+    removed = []
+    for j, name in enumerate(names):
+        if name in first:
+            mapping.append(first[name])
+            removed.append(j)
+        else:
+            first[name] = len(first)
+            mapping.append(first[name])
+    if len(removed) == 0 and all(key.ska_name == name for key, name in zip(keys, names)): return
+
+    groups.remap_indices(obj, groupIndex, mapping)
+    groups.set_keys(group, list(first))
+
+def merge(obj, duplicates):
+    """Merges the duplicate shape keys { name: kept name } of the mesh of the object.
+    Returns the number of shape keys removed"""
+    if len(duplicates) == 0: return 0
+    mesh_users = users(obj.data)
+    for user in mesh_users:
+        for groupIndex in range(len(user.ska_groups)):
+            _merge_group(user, groupIndex, duplicates)
+
+    shape_keys = obj.data.shape_keys
+    anim_data = shape_keys.animation_data
+    action = None
+    if anim_data is not None: action = anim_data.action
+    for name in duplicates:
+        key_block = shape_keys.key_blocks[name]
+        if action is not None:
+            fcurve = action.fcurves.find(key_block.path_from_id('value'))
+            if fcurve is not None: action.fcurves.remove(fcurve)
+        obj.shape_key_remove(key_block)
+
+    for user in mesh_users:
+        cache.invalidate(user)
+        registry.update(user)
+    return len(duplicates)
+
+def _megabytes(size):
+    return "{:.1f} MB".format(size / 1048576)
+
+class DUSKA_OT_prune_keys( bpy.types.Operator ):
+    bl_idname = "object.ska_prune_keys"
+    bl_label = "Find Duplicate Shape Keys"
+    bl_description = "Finds the Shape Keys which are the same as the basis or as another key, and optionally merges them"
+    bl_options = {'REGISTER','UNDO'}
+
+    tolerance: bpy.props.FloatProperty(name="Tolerance", default=0.0001, min=0.0, precision=5, subtype='DISTANCE',
+        description="The maximum distance between the vertices of two keys considered the same")
+    merge: bpy.props.BoolProperty(name="Merge", default=False,
+        description="Removes the duplicates used only by DuSKA; the Animated Keys and their animation use the kept keys instead")
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.object
+        if obj is None or obj.type != 'MESH': return False
+        return obj.data.shape_keys is not None
+
+    def execute(self, context):
+        obj = context.object
+        analysis = analyze(obj, self.tolerance)
+        if analysis is None: return {'CANCELLED'}
+
+        num_duplicates = len(analysis.duplicates)
+        message = (str(analysis.num_keys) + " shape keys (" + _megabytes(analysis.memory) + "): " +
+            str(len(analysis.basis_like)) + " same as the basis, " +
+            str(num_duplicates - len(analysis.basis_like)) + " duplicates of other keys (" +
+            _megabytes(num_duplicates * analysis.key_size) + ")")
+        if self.merge:
+            num_merged = merge(obj, analysis.mergeable)
+            message = message + ", " + str(num_merged) + " merged"
+        self.report({'INFO'}, message)
+        if num_duplicates > 0:
+            self.report({'INFO'}, "Duplicates: " + ", ".join(name + " = " + original for name, original in analysis.duplicates.items()))
+        return {'FINISHED'}
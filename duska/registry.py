@@ -0,0 +1,145 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Registry of the objects animated with DuSKA.
+
+The frame handler only visits the objects listed here instead of scanning all of bpy.data.objects.
+Objects which have been baked are not listed.
+The operators keep it up to date; it is rebuilt when a file is loaded, after undo/redo,
+and whenever the number of objects in the file changes (new, duplicated or deleted objects).
+
+Objects sharing the same shape keys (linked duplicates, linked library instances) can't have different
+shape key values: only one of them, the driver, is evaluated. The driver is the first of these objects
+sorted by name (and library path for linked objects), so it doesn't depend on the selection or the order
+of the objects in the file. The other ones are listed in the registry but their animation is ignored.
+"""
+
+import bpy # pylint: disable=import-error
+
+from . import groups
+from . import tracking
+
+_objects = {} # { pointer: obj }
+_dirty = True
+_num_objects = -1
+# The objects grouped by shape keys, updated when _objects changes
+_drivers = []
+_users = {} # { shape keys pointer: (objects) }, the driver first
+_drivers_dirty = True
+
+def has_ska_keys(obj):
+    """Checks if the object has at least one non-empty SKA group"""
+    if obj is None: return False
+    if obj.type != 'CURVE' and obj.type != 'MESH': return False
+    return groups.is_used(obj)
+
+def uses_handler(obj):
+    """Checks if the object has to be updated by the frame handler"""
+    return has_ska_keys(obj) and not obj.ska_baked
+
+def invalidate():
+    """Marks the registry as outdated, it will be rebuilt the next time it's used"""
+    global _dirty, _drivers_dirty
+    _dirty = True
+    _drivers_dirty = True
+
+def _shape_keys_pointer(obj):
+    shape_keys = obj.data.shape_keys
+    if shape_keys is None: return obj.as_pointer() # not shared
+    return shape_keys.as_pointer()
+
+def _sort_key(obj):
+    library = ''
+    if obj.library is not None: library = obj.library.filepath
+    return (obj.name, library)
+
+def _group_drivers():
+    global _drivers_dirty
+    grouped = {}
+    for obj in _objects.values():
+        grouped.setdefault(_shape_keys_pointer(obj), []).append(obj)
+    _users.clear()
+    _drivers.clear()
+    for ptr, users in grouped.items():
+        users.sort(key=_sort_key)
+        _users[ptr] = tuple(users)
+        _drivers.append(users[0])
+    _drivers_dirty = False
+
+def rebuild():
+    """Scans all the objects of the file to find the ones using DuSKA"""
+    global _dirty, _num_objects
+    _objects.clear()
+    objects = bpy.data.objects
+    for obj in objects:
+        if uses_handler(obj):
+            _objects[obj.as_pointer()] = obj
+    _num_objects = len(objects)
+    _dirty = False
+    _group_drivers()
+    tracking.subscribe_all(_objects.values())
+
+def update(obj):
+    """Adds or removes the object, depending on its SKA lists"""
+    global _drivers_dirty
+    if _dirty: return
+    _drivers_dirty = True
+    if uses_handler(obj):
+        _objects[obj.as_pointer()] = obj
+        # the groups may have changed
+        tracking.subscribe(obj)
+    else:
+        _objects.pop(obj.as_pointer(), None)
+
+def objects():
+    """Returns the list of the objects using DuSKA"""
+    if _dirty or len(bpy.data.objects) != _num_objects:
+        rebuild()
+    return list(_objects.values())
+
+def _refresh():
+    if _dirty or len(bpy.data.objects) != _num_objects:
+        rebuild()
+    elif _drivers_dirty:
+        _group_drivers()
+
+def drivers():
+    """Returns the objects to evaluate: one per shape keys datablock"""
+    _refresh()
+    return list(_drivers)
+
+def users(obj):
+    """Returns the objects using DuSKA which share the shape keys of the object, the driver first (a tuple)"""
+    _refresh()
+    return _users.get(_shape_keys_pointer(obj), ())
+
+def unique_drivers(objects):
+    """Replaces the objects by the drivers of their shape keys, without duplicates"""
+    result = {}
+    for obj in objects:
+        driver = driver_of(obj)
+        if driver is None: driver = obj
+        result.setdefault(driver.as_pointer(), driver)
+    return list(result.values())
+
+def driver_of(obj):
+    """Returns the object whose animation drives the shape keys of the object, None if it isn't animated by DuSKA"""
+    objects = users(obj)
+    if len(objects) == 0: return None
+    return objects[0]
@@ -0,0 +1,117 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""An in-memory stand-in for the Blender data used by DuSKA.
+
+It runs the evaluation core the same way update_keys_handler does, but without Blender,
+to test and benchmark it headless.
+
+The duska package can't be imported without Blender (its __init__ needs bpy);
+load it as a namespace package instead:
+
+    import sys, types
+    duska = types.ModuleType('duska')
+    duska.__path__ = ['path/to/duska']
+    sys.modules['duska'] = duska
+    from duska import standin
+"""
+
+from . import core
+from . import keyframes
+
+class KeyBlock():
+    """A shape key"""
+
+    def __init__(self, name, value=0.0):
+        self.name = name
+        self.value = value
+
+class StandInObject():
+    """An object with shape keys and SKA lists"""
+
+    def __init__(self, name, key_names):
+        self.name = name
+        self.key_blocks = [ KeyBlock(key_name) for key_name in key_names ]
+        self.lists = [] # core.SkaList, with the names of the keys
+        self.blend_mode = 'MEAN'
+        self.applied = {} # the last weights written, { index: value }
+        self._lists = [] # core.SkaList, with the key_block indices
+        self._managed = None
+
+    def add_list(self, names, active_index=0, keys=None, weight=1.0):
+        """Adds a SKA list (a group) and returns it.
+        keys are the keyframes of the active index: a list of (frame, index, constant) tuples;
+        None if the list is not animated"""
+        tables = None
+        if keys is not None:
+            keys = sorted(keys)
+            times = [ float(key[0]) for key in keys ]
+            values = [ float(key[1]) for key in keys ]
+            constant = [ bool(key[2]) for key in keys ]
+            tables = [ keyframes.KeyframeTable(times, values, constant) ]
+        ska_list = core.SkaList(list(names), active_index, tables, weight)
+        self.lists.append(ska_list)
+        self.invalidate()
+        return ska_list
+
+    def invalidate(self):
+        """Must be called when the lists or the shape keys are edited"""
+        self._managed = None
+        self.applied.clear()
+
+    def _build_maps(self):
+        blocks = { key_block.name: i for i, key_block in enumerate(self.key_blocks) }
+        self._lists = []
+        managed = set()
+        for ska_list in self.lists:
+            indices = [ blocks.get(name) for name in ska_list.keys ]
+            managed.update(i for i in indices if i is not None)
+            self._lists.append( core.SkaList(indices, ska_list.active_index, ska_list.tables, ska_list.weight) )
+        self._managed = frozenset(managed)
+
+    def update(self, frame, stats=None):
+        """Evaluates the lists at the frame and writes the changed values of the shape keys, like update_ska_index.
+        Returns the number of values written"""
+        if self._managed is None:
+            self._build_maps()
+        for ska_list, indexed_list in zip(self.lists, self._lists):
+            indexed_list.active_index = ska_list.active_index
+            indexed_list.weight = ska_list.weight
+        weights = core.evaluate(self._lists, frame, self.blend_mode)
+        if len(weights) == 0: return 0
+        changed = core.changed_weights(self.applied, core.resolve(weights, self._managed), stats)
+        for i, value in changed:
+            self.key_blocks[i].value = value
+        return len(changed)
+
+class StandInScene():
+    """A list of objects updated when the frame changes, like update_keys_handler does"""
+
+    def __init__(self):
+        self.objects = []
+        self.frame_current = 1
+        self.write_stats = core.WriteStats()
+
+    def frame_set(self, frame):
+        self.frame_current = frame
+        self.update()
+
+    def update(self):
+        for obj in self.objects:
+            obj.update(self.frame_current, self.write_stats)
@@ -0,0 +1,115 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Optional timing instrumentation of the frame handler.
+
+When enabled, update_keys_handler records, for each frame: the total time spent,
+the number of objects visited and actually evaluated, the number of shape key values written
+and of the writes skipped because the values didn't change, and the slowest objects. The last frames are kept in a rolling window.
+
+    from duska import stats
+    stats.enable()
+    ... play the animation ...
+    print(stats.summary())
+
+When disabled (the default), the handler only checks stats.enabled once per frame.
+"""
+
+import heapq
+from collections import deque
+from time import perf_counter
+
+NUM_SLOWEST = 5
+
+enabled = False
+_frames = deque(maxlen=250)
+
+class FrameRecord():
+    """The measures of one call of the frame handler"""
+
+    def __init__(self, frame, visited):
+        self.frame = frame
+        self.visited = visited
+        self.evaluated = 0
+        self.writes = 0
+        self.skipped = 0
+        self.time = 0.0
+        self.objects = [] # (time, name)
+        self._start = perf_counter()
+
+    def add_object(self, name, time, evaluated):
+        self.objects.append( (time, name) )
+        if evaluated: self.evaluated = self.evaluated + 1
+
+    def finish(self, writes, skipped):
+        self.time = perf_counter() - self._start
+        self.writes = writes
+        self.skipped = skipped
+        # Only keep the slowest objects
+        self.objects = heapq.nlargest(NUM_SLOWEST, self.objects)
+
+def enable(value=True):
+    """Enables or disables the instrumentation"""
+    global enabled
+    enabled = value
+
+def set_window(num_frames):
+    """Sets the number of frames kept to compute the statistics"""
+    global _frames
+    _frames = deque(_frames, maxlen=max(1, num_frames))
+
+def reset():
+    """Clears all the measures"""
+    _frames.clear()
+
+def begin_frame(frame, visited):
+    """Starts recording a call of the frame handler, returns the FrameRecord to fill"""
+    return FrameRecord(frame, visited)
+
+def end_frame(record, writes, skipped=0):
+    """Finishes and stores the record"""
+    record.finish(writes, skipped)
+    _frames.append(record)
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+def summary():
+    """Returns the statistics over the rolling window, as a dict; None if nothing has been recorded"""
+    if len(_frames) == 0: return None
+    frames = list(_frames)
+    times = sorted(record.time for record in frames)
+    num_frames = len(frames)
+    # the worst time of each object
+    worst = {}
+    for record in frames:
+        for time, name in record.objects:
+            if time > worst.get(name, 0.0): worst[name] = time
+    slowest = heapq.nlargest(NUM_SLOWEST, ( (time, name) for name, time in worst.items() ))
+    return {
+        'frames': num_frames,
+        'time_p50_ms': _percentile(times, 0.5) * 1000,
+        'time_p95_ms': _percentile(times, 0.95) * 1000,
+        'time_max_ms': times[-1] * 1000,
+        'visited': sum(record.visited for record in frames) / num_frames,
+        'evaluated': sum(record.evaluated for record in frames) / num_frames,
+        'writes': sum(record.writes for record in frames) / num_frames,
+        'skipped': sum(record.skipped for record in frames) / num_frames,
+        'slowest': [ (name, time * 1000) for time, name in slowest ],
+    }
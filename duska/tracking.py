@@ -0,0 +1,118 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Tracks the changes of the SKA data of each object.
+
+Each object has a generation counter, incremented each time its SKA data may have changed.
+The caches store the generation they've been built with, and are outdated (dirty) as soon as it differs:
+editing an object only invalidates the caches of this object.
+
+The changes are detected with:
+- msgbus subscriptions on the groups (keys, active index, weight), the blend mode and the names of the key_blocks,
+  for the edits made in the interface;
+- the depsgraph updates of the actions (keyframes edited) and of the objects (properties edited);
+- tag(obj), called by the operators of DuSKA.
+"""
+
+import bpy # pylint: disable=import-error
+
+_generations = {} # { object pointer: generation }
+_owners = {} # { object pointer: msgbus owner }
+_next_generation = 1
+_base_generation = 0 # the generation of the objects which haven't changed since clear()
+# functions called with the pointer of each object tagged as changed
+listeners = []
+
+def generation(obj):
+    """Returns the current generation of the object"""
+    return _generations.get(obj.as_pointer(), _base_generation)
+
+def is_dirty(obj, known_generation):
+    """Checks if the object has changed since known_generation"""
+    return generation(obj) != known_generation
+
+def _tag_pointer(ptr):
+    global _next_generation
+    # Generations are unique among all objects, so that a cache can't be valid
+    # for a new object allocated at the same address
+    _generations[ptr] = _next_generation
+    _next_generation = _next_generation + 1
+    for listener in listeners:
+        listener(ptr)
+
+def tag(obj):
+    """Marks the SKA data of the object as changed"""
+    _tag_pointer(obj.as_pointer())
+
+def tag_action(action, objects):
+    """Marks the objects animated by the action (among objects) as changed"""
+    for obj in objects:
+        anim_data = obj.animation_data
+        if anim_data is None: continue
+        if anim_data.action == action:
+            tag(obj)
+            continue
+        for track in anim_data.nla_tracks:
+            if any(strip.action == action for strip in track.strips):
+                tag(obj)
+                break
+
+def _subscribe(key, owner, ptr):
+    bpy.msgbus.subscribe_rna(key=key, owner=owner, args=(ptr,), notify=_tag_pointer)
+
+def subscribe(obj):
+    """(Re)subscribes to the changes of the SKA data of the object"""
+    ptr = obj.as_pointer()
+    owner = _owners.get(ptr)
+    if owner is None:
+        owner = object()
+        _owners[ptr] = owner
+    else:
+        bpy.msgbus.clear_by_owner(owner)
+
+    _subscribe(obj.path_resolve('ska_groups', False), owner, ptr)
+    _subscribe(obj.path_resolve('ska_blend_mode', False), owner, ptr)
+    for group in obj.ska_groups:
+        _subscribe(group.path_resolve('keys', False), owner, ptr)
+        _subscribe(group.path_resolve('active_index', False), owner, ptr)
+        _subscribe(group.path_resolve('weight', False), owner, ptr)
+    shape_keys = obj.data.shape_keys
+    if shape_keys is not None:
+        _subscribe(shape_keys.path_resolve('key_blocks', False), owner, ptr)
+        for key_block in shape_keys.key_blocks:
+            _subscribe(key_block.path_resolve('name', False), owner, ptr)
+
+def subscribe_all(objects):
+    """Clears all the subscriptions and subscribes to the changes of the objects"""
+    unsubscribe_all()
+    for obj in objects:
+        subscribe(obj)
+
+def unsubscribe_all():
+    for owner in _owners.values():
+        bpy.msgbus.clear_by_owner(owner)
+    _owners.clear()
+
+def clear():
+    """Marks all the objects as changed"""
+    global _next_generation, _base_generation
+    # Caches built with older generations can't match anymore
+    _generations.clear()
+    _base_generation = _next_generation
+    _next_generation = _next_generation + 1
@@ -0,0 +1,201 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Persistent cache of the weights of the objects, for all the frames of the scene.
+
+When Object.ska_weight_cache is enabled, the weights of the frame range are evaluated at once
+with bake.evaluate_range and stored in the object, in the '_duska_weights' bytes property:
+a JSON header, then the float32 weights of each frame (rows) for each managed key_block (columns).
+The frame handler then just reads the row of the current frame.
+
+The header contains a hash of everything the evaluation depends on (key_block names, groups and keys,
+active index and weight curves, blend mode). The cache is checked lazily the first time it's needed
+and each time the generation of the object changes (see tracking.py);
+it is rebuilt when the hash or the frame range have changed.
+"""
+
+import json
+import hashlib
+import numpy as np
+
+from .dublf import animation as dublf_animation # pylint: disable=import-error
+from . import cache
+from . import groups
+from . import bake
+from . import tracking
+
+PROPERTY = '_duska_weights'
+VERSION = 1
+
+class WeightCache():
+    """The weights of an object for a frame range"""
+
+    def __init__(self, key, frame_start, indices, weights):
+        self.key = key
+        self.frame_start = frame_start
+        self.indices = indices
+        # float32 array (frames, indices); None if the animation can't be cached
+        self.weights = weights
+        # the generation of the object when this cache has been checked
+        self.generation = None
+
+    @property
+    def frame_end(self):
+        if self.weights is None: return self.frame_start - 1
+        return self.frame_start + len(self.weights) - 1
+
+    def weights_at(self, frame):
+        """Returns the weights { index: weight } at the frame, None if the frame is not cached"""
+        if self.weights is None: return None
+        row = int(frame) - self.frame_start
+        if row != frame - self.frame_start or row < 0 or row >= len(self.weights): return None
+        return dict(zip(self.indices, self.weights[row].tolist()))
+
+    def to_bytes(self):
+        header = json.dumps({
+            'version': VERSION,
+            'key': self.key,
+            'frame_start': self.frame_start,
+            'indices': self.indices,
+            })
+        return header.encode() + b'\0' + np.ascontiguousarray(self.weights, dtype=np.float32).tobytes()
+
+def from_bytes(data):
+    """Reads a WeightCache stored with to_bytes; None if the data is not valid"""
+    sep = data.find(b'\0')
+    if sep < 0: return None
+    try:
+        header = json.loads(data[:sep].decode())
+    except ValueError:
+        return None
+    if header.get('version') != VERSION: return None
+    indices = header['indices']
+    weights = np.frombuffer(data[sep + 1:], dtype=np.float32)
+    if len(indices) == 0 or len(weights) % len(indices) != 0: return None
+    weights = weights.reshape(-1, len(indices))
+    return WeightCache(header['key'], header['frame_start'], indices, weights)
+
+_weight_attributes = ('co', 'handle_left', 'handle_right')
+_weight_enums = ('interpolation', 'easing')
+_weight_settings = ('back', 'amplitude', 'period')
+
+def animation_hash(obj, eval_map):
+    """Returns a hash of all the data the evaluation of the object depends on,
+    None if the animation can't be cached"""
+    h = hashlib.sha1()
+    def add(*values):
+        h.update(repr(values).encode())
+
+    add(tuple(eval_map.blocks), eval_map.list_names, obj.ska_blend_mode)
+    animated = dublf_animation.is_animated(obj)
+    add(animated)
+    for i in eval_map.groups:
+        group = obj.ska_groups[i]
+        add(i)
+        # The current active index and weight change with the frame when they're animated:
+        # they're used only when they have no keyframes (see bake.evaluate_range)
+        index_curves = list(dublf_animation.get_curves(obj, groups.index_path(i))) if animated else []
+        weight_curves = list(dublf_animation.get_curves(obj, groups.weight_path(i))) if animated else []
+        if not animated or any(len(fcurve.keyframe_points) == 0 for fcurve in index_curves):
+            add(group.active_index)
+        if len(weight_curves) == 0:
+            add(group.weight)
+        for fcurve in index_curves:
+            table = cache.get_keyframe_table(fcurve)
+            add(tuple(table.times), tuple(table.values), tuple(table.constant))
+        for fcurve in weight_curves:
+            # The weight curves are evaluated by Blender, with all their settings
+            if len(fcurve.modifiers) > 0: return None
+            keyframe_points = fcurve.keyframe_points
+            num_keys = len(keyframe_points)
+            add(fcurve.extrapolation, num_keys)
+            for attribute in _weight_attributes:
+                values = np.empty(num_keys * 2, dtype=np.float32)
+                keyframe_points.foreach_get(attribute, values)
+                h.update(values.tobytes())
+            for setting in _weight_enums:
+                values = np.empty(num_keys, dtype=np.int32)
+                keyframe_points.foreach_get(setting, values)
+                h.update(values.tobytes())
+            for setting in _weight_settings:
+                values = np.empty(num_keys, dtype=np.float32)
+                keyframe_points.foreach_get(setting, values)
+                h.update(values.tobytes())
+    return h.hexdigest()
+
+_entries = {} # { object pointer: WeightCache }
+
+def build(obj, eval_map, key, frame_start, frame_end):
+    """Evaluates the frame range and stores the weights in the object.
+    The weights of linked objects and library overrides can't be stored, they're only kept in memory"""
+    frames = np.arange(frame_start, frame_end + 1, dtype=np.float64)
+    indices, weights = bake.evaluate_range(obj, frames)
+    entry = WeightCache(key, frame_start, [ int(i) for i in indices ], weights.astype(np.float32))
+    if len(indices) > 0 and is_editable(obj):
+        obj[PROPERTY] = entry.to_bytes()
+    return entry
+
+def is_editable(obj):
+    """Checks if the cache can be stored in the object"""
+    return obj.library is None and getattr(obj, 'override_library', None) is None
+
+def load(obj):
+    """Reads the cache stored in the object, None if there's none"""
+    data = obj.get(PROPERTY)
+    if not isinstance(data, bytes): return None
+    return from_bytes(data)
+
+def get(obj, eval_map, scene):
+    """Returns the WeightCache of the object, checks it and rebuilds it if needed"""
+    ptr = obj.as_pointer()
+    entry = _entries.get(ptr)
+    if entry is not None and not tracking.is_dirty(obj, entry.generation):
+        if entry.weights is None: return entry
+        if entry.frame_start == scene.frame_start and entry.frame_end == scene.frame_end: return entry
+
+    key = animation_hash(obj, eval_map)
+    if key is None:
+        entry = WeightCache(None, 0, [], None)
+    else:
+        if entry is None or entry.key != key:
+            entry = load(obj)
+        if entry is None or entry.key != key or entry.frame_start != scene.frame_start or entry.frame_end != scene.frame_end:
+            entry = build(obj, eval_map, key, scene.frame_start, scene.frame_end)
+    entry.generation = tracking.generation(obj)
+    _entries[ptr] = entry
+    return entry
+
+def weights_at(obj, eval_map, scene, frame):
+    """Returns the cached weights { index: weight } of the object at the frame,
+    None if they're not cached and the object must be evaluated"""
+    return get(obj, eval_map, scene).weights_at(frame)
+
+def invalidate(obj):
+    """The cache of the object will be checked again the next time it's used"""
+    _entries.pop(obj.as_pointer(), None)
+
+def remove(obj):
+    """Removes the cache stored in the object"""
+    invalidate(obj)
+    if is_editable(obj) and PROPERTY in obj:
+        del obj[PROPERTY]
+
+def clear():
+    """The caches of all the objects will be checked again"""
+    _entries.clear()
@@ -0,0 +1,150 @@
+"""Tests of the evaluation core, without Blender: python -m pytest tests"""
+
+import os
+import sys
+import types
+import unittest
+from bisect import bisect_right
+
+# duska/__init__ needs bpy: the package is loaded as a namespace package (see standin.py)
+if not 'duska' in sys.modules:
+    duska = types.ModuleType('duska')
+    duska.__path__ = [ os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'duska') ]
+    sys.modules['duska'] = duska
+
+from duska import core # pylint: disable=import-error,wrong-import-position
+from duska import keyframes # pylint: disable=import-error,wrong-import-position
+from duska import standin # pylint: disable=import-error,wrong-import-position
+
+def blend(mode, lists):
+    """Blends lists of (weight, { key: weight })"""
+    accumulator = core.Accumulator(mode)
+    for list_weight, weights in lists:
+        for key, weight in weights.items():
+            accumulator.add(key, weight)
+        accumulator.end_list(list_weight)
+    return accumulator.result()
+
+class TestAccumulator(unittest.TestCase):
+
+    lists = [ (1.0, { 'A': 1.0 }), (0.5, { 'A': 0.5, 'B': 0.5 }) ]
+
+    def test_mean(self):
+        result = blend('MEAN', self.lists)
+        self.assertAlmostEqual(result['A'], 1.25 / 1.5)
+        self.assertAlmostEqual(result['B'], 0.5)
+
+    def test_add(self):
+        result = blend('ADD', self.lists)
+        self.assertAlmostEqual(result['A'], 1.0) # clamped
+        self.assertAlmostEqual(result['B'], 0.25)
+
+    def test_max(self):
+        result = blend('MAX', self.lists)
+        self.assertAlmostEqual(result['A'], 1.0)
+        self.assertAlmostEqual(result['B'], 0.25)
+
+    def test_normalize(self):
+        result = blend('NORMALIZE', self.lists)
+        self.assertAlmostEqual(result['A'], 1.25 / 1.5)
+        self.assertAlmostEqual(result['B'], 0.25 / 1.5)
+        self.assertAlmostEqual(sum(result.values()), 1.0)
+
+    def test_same_key_in_a_list(self):
+        accumulator = core.Accumulator('MEAN')
+        accumulator.add('A', 0.25)
+        accumulator.add('A', 0.75)
+        accumulator.add(None, 1.0)
+        self.assertEqual(accumulator.result(), { 'A': 1.0 })
+
+    def test_empty(self):
+        self.assertEqual(blend('NORMALIZE', [ (1.0, {}) ]), {})
+
+class TestKeyframeTable(unittest.TestCase):
+
+    def check(self, times, frames):
+        table = keyframes.KeyframeTable(times, list(range(len(times))), [False] * len(times))
+        for frame in frames:
+            self.assertEqual(table.previous_index(frame), bisect_right(times, frame) - 1, frame)
+
+    def test_sequential(self):
+        # the cursor on the current and next segments
+        self.check([0.0, 10.0, 20.0, 30.0], [ f * 0.5 for f in range(-4, 70) ])
+
+    def test_jumps(self):
+        # binary search
+        self.check([0.0, 10.0, 20.0, 30.0, 40.0], [35.0, 5.0, 40.0, -1.0, 25.0, 25.0, 12.0, 100.0, 0.0])
+
+    def test_duplicate_times(self):
+        times = [0.0, 10.0, 10.0, 10.0, 20.0]
+        self.check(times, [ f * 0.5 for f in range(-2, 50) ])
+        self.check(times, [10.0, 5.0, 10.0, 20.0, 10.0])
+
+    def test_empty(self):
+        self.assertEqual(keyframes.KeyframeTable([], [], []).previous_index(1.0), -1)
+
+    def test_from_arrays(self):
+        # unsorted keyframes, interpolation 0 is constant
+        table = keyframes.from_arrays([20.0, 2.0, 0.0, 1.0], [1, 0], 0)
+        self.assertEqual(table.times, [0.0, 20.0])
+        self.assertEqual(table.values, [1.0, 2.0])
+        self.assertEqual(table.constant, [True, False])
+
+class TestEvaluation(unittest.TestCase):
+
+    names = [ 'Basis', 'A', 'B', 'C' ]
+
+    def make(self, keys, active_index=0):
+        obj = standin.StandInObject('Object', self.names)
+        obj.add_list(self.names[1:], active_index, keys)
+        return obj
+
+    def values(self, obj, frame):
+        obj.update(frame)
+        return { key_block.name: key_block.value for key_block in obj.key_blocks if key_block.name != 'Basis' }
+
+    def core_weights(self, obj, frame):
+        weights = core.evaluate(obj.lists, frame, obj.blend_mode)
+        return core.resolve(weights, self.names[1:])
+
+    def assertParity(self, obj, frame):
+        values = self.values(obj, frame)
+        for name, weight in self.core_weights(obj, frame).items():
+            self.assertAlmostEqual(values[name], weight, msg=str(frame))
+        return values
+
+    def test_not_animated(self):
+        obj = self.make(None, 1)
+        self.assertEqual(self.assertParity(obj, 5.0), { 'A': 0.0, 'B': 1.0, 'C': 0.0 })
+
+    def test_hold(self):
+        obj = self.make([ (0, 0, True), (10, 2, False) ])
+        self.assertEqual(self.assertParity(obj, 5.0), { 'A': 1.0, 'B': 0.0, 'C': 0.0 })
+        # after the last key
+        self.assertEqual(self.assertParity(obj, 15.0), { 'A': 0.0, 'B': 0.0, 'C': 1.0 })
+
+    def test_interpolation(self):
+        obj = self.make([ (0, 0, False), (10, 2, False) ])
+        values = self.assertParity(obj, 2.5)
+        self.assertAlmostEqual(values['A'], 0.75)
+        self.assertAlmostEqual(values['C'], 0.25)
+        self.assertEqual(values['B'], 0.0)
+        for frame in range(-5, 20):
+            self.assertParity(obj, frame * 0.75)
+
+    def test_before_first_key(self):
+        # the first key is held, whatever the current active index
+        obj = self.make([ (10, 0, False), (20, 1, False) ], active_index=2)
+        self.assertEqual(self.assertParity(obj, 0.0), { 'A': 1.0, 'B': 0.0, 'C': 0.0 })
+        obj = self.make([ (10, 1, False) ], active_index=2)
+        self.assertEqual(self.assertParity(obj, 0.0), { 'A': 0.0, 'B': 1.0, 'C': 0.0 })
+
+    def test_unchanged_values_not_written(self):
+        obj = self.make([ (0, 0, True), (10, 2, False) ])
+        stats = core.WriteStats()
+        obj.update(1.0, stats)
+        obj.update(2.0, stats)
+        self.assertEqual(stats.skipped_objects, 1)
+
+if __name__ == '__main__':
+    unittest.main()
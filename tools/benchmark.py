@@ -0,0 +1,285 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+"""Benchmarks DuSKA on synthetic scenes and prints the results as JSON.
+
+In Blender, with the add-on installed:
+    blender --background --factory-startup --python benchmark.py -- --objects 20000 --ska-objects 200
+
+Without Blender, with the in-memory stand-in backend (only the evaluation is timed):
+    python3 benchmark.py --ska-objects 200,400 --key-blocks 300
+
+All the scene parameters accept comma-separated values; all the combinations are benchmarked.
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import itertools
+import platform
+
+try:
+    import bpy # pylint: disable=import-error
+except ImportError:
+    bpy = None
+
+SCENE_PARAMETERS = ('objects', 'ska_objects', 'key_blocks', 'keys_per_list', 'lists', 'keyframes')
+
+def get_arguments():
+    argv = sys.argv
+    if '--' in argv: argv = argv[argv.index('--') + 1:]
+    elif bpy is not None: argv = []
+    else: argv = argv[1:]
+
+    parser = argparse.ArgumentParser(description="Benchmarks DuSKA on synthetic scenes")
+    parser.add_argument('--objects', default='1000', help="Number of objects in the scene, including the ones not using DuSKA (Blender only)")
+    parser.add_argument('--ska-objects', default='100', help="Number of objects animated with DuSKA")
+    parser.add_argument('--key-blocks', default='50', help="Number of shape keys per object")
+    parser.add_argument('--keys-per-list', default='20', help="Number of SKA keys per list")
+    parser.add_argument('--lists', default='1', help="Number of SKA groups in use per object")
+    parser.add_argument('--keyframes', default='100', help="Number of keyframes on each active index curve")
+    parser.add_argument('--frames', type=int, default=100, help="Number of frames evaluated")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of times each measure is repeated")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='', help="Writes the JSON results to this file instead of the standard output")
+    args = parser.parse_args(argv)
+
+    grid = []
+    for name in SCENE_PARAMETERS:
+        grid.append( [int(v) for v in getattr(args, name).split(',')] )
+    args.scenes = [ dict(zip(SCENE_PARAMETERS, values)) for values in itertools.product(*grid) ]
+    return args
+
+def summarize(times):
+    """Returns the statistics of a list of durations in seconds, in milliseconds"""
+    if len(times) == 0: return None
+    times = sorted(times)
+    def percentile(p):
+        return times[min(len(times) - 1, int(round(p * (len(times) - 1))))] * 1000
+    return {
+        'count': len(times),
+        'mean_ms': sum(times) / len(times) * 1000,
+        'min_ms': times[0] * 1000,
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'max_ms': times[-1] * 1000,
+    }
+
+def random_keys(rnd, params):
+    """Generates the keyframes of an active index curve: (frame, index, constant)"""
+    keys = []
+    frame = 1
+    for _ in range(params['keyframes']):
+        keys.append( (frame, rnd.randrange(params['keys_per_list']), rnd.random() < 0.5) )
+        frame = frame + rnd.randint(1, 4)
+    return keys
+
+def load_standin():
+    """Imports duska as a namespace package, without running its __init__ which needs bpy"""
+    import types
+    duska = types.ModuleType('duska')
+    duska.__path__ = [ os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'duska') ]
+    sys.modules['duska'] = duska
+    from duska import standin # pylint: disable=import-error
+    return standin
+
+# ========== STAND-IN ==========
+
+def standin_scene(standin, rnd, params):
+    scene = standin.StandInScene()
+    for o in range(params['ska_objects']):
+        key_names = [ 'Key.' + str(k) for k in range(params['key_blocks']) ]
+        obj = standin.StandInObject('Object.' + str(o), key_names)
+        for l in range(params['lists']):
+            names = [ key_names[(l * params['keys_per_list'] + k) % len(key_names)] for k in range(params['keys_per_list']) ]
+            obj.add_list(names, 0, random_keys(rnd, params))
+        scene.objects.append(obj)
+    return scene
+
+def standin_benchmark(standin, args, params):
+    rnd = random.Random(args.seed)
+    scene = standin_scene(standin, rnd, params)
+    handler_times = []
+    for _ in range(args.repeat):
+        for frame in range(1, args.frames + 1):
+            start = time.perf_counter()
+            scene.frame_set(frame)
+            handler_times.append(time.perf_counter() - start)
+    return {
+        'handler': summarize(handler_times),
+        'writes': vars(scene.write_stats),
+    }
+
+# ========== BLENDER ==========
+
+def clear_data():
+    """Removes the objects of the previous scene.
+    Reading the factory settings would also reset the add-ons, and unregister DuSKA"""
+    ids = list(bpy.data.objects) + list(bpy.data.meshes) + list(bpy.data.actions)
+    # the shape keys are removed with their mesh
+    bpy.data.batch_remove(ids)
+
+def blender_scene(duska, rnd, params):
+    """Creates a new scene with the synthetic objects"""
+    clear_data()
+    scene = bpy.context.scene
+    collection = scene.collection
+
+    # The objects not using DuSKA share the same mesh
+    static_mesh = bpy.data.meshes.new('Static')
+    static_mesh.from_pydata([(0,0,0),(1,0,0),(0,1,0)], [], [(0,1,2)])
+    for o in range(max(0, params['objects'] - params['ska_objects'])):
+        collection.objects.link( bpy.data.objects.new('Static.' + str(o), static_mesh) )
+
+    ska_objects = []
+    for o in range(params['ska_objects']):
+        mesh = bpy.data.meshes.new('SKA.' + str(o))
+        mesh.from_pydata([(0,0,0),(1,0,0),(0,1,0)], [], [(0,1,2)])
+        obj = bpy.data.objects.new('SKA.' + str(o), mesh)
+        collection.objects.link(obj)
+        key_names = [ obj.shape_key_add(name='Key.' + str(k), from_mix=False).name for k in range(params['key_blocks']) ]
+        if params['lists'] > 0:
+            obj.animation_data_create()
+            obj.animation_data.action = bpy.data.actions.new('SKA.' + str(o))
+        for l in range(params['lists']):
+            ska_keys = obj.ska_groups.add().keys
+            for k in range(params['keys_per_list']):
+                ska_keys.add().ska_name = key_names[(l * params['keys_per_list'] + k) % len(key_names)]
+            keys = random_keys(rnd, params)
+            fcurve = obj.animation_data.action.fcurves.new(duska.groups.index_path(l))
+            fcurve.keyframe_points.add(len(keys))
+            co = []
+            for key in keys: co.extend( (key[0], key[1]) )
+            fcurve.keyframe_points.foreach_set('co', co)
+            for keyframe, key in zip(fcurve.keyframe_points, keys):
+                keyframe.interpolation = 'CONSTANT' if key[2] else 'LINEAR'
+            fcurve.update()
+        ska_objects.append(obj)
+
+    duska.cache.clear()
+    duska.registry.invalidate()
+    return scene, ska_objects
+
+class DrawLayout():
+    """Stands for a UILayout in background mode, where the UI can't be drawn"""
+    def prop(self, *args, **kwargs):
+        pass
+
+class DrawContext():
+    def __init__(self, obj):
+        self.object = obj
+
+def blender_benchmark(duska, args, params):
+    rnd = random.Random(args.seed)
+    scene, ska_objects = blender_scene(duska, rnd, params)
+    result = {}
+
+    # Frame handler
+    handler_times = []
+    duska.cache.write_stats.reset()
+    for _ in range(args.repeat):
+        for frame in range(1, args.frames + 1):
+            scene.frame_current = frame
+            start = time.perf_counter()
+            duska.update_keys_handler(scene)
+            handler_times.append(time.perf_counter() - start)
+    result['handler'] = summarize(handler_times)
+    result['writes'] = vars(duska.cache.write_stats)
+
+    # Complete frame change, with the depsgraph evaluation
+    frame_times = []
+    for frame in range(1, args.frames + 1):
+        start = time.perf_counter()
+        scene.frame_set(frame)
+        frame_times.append(time.perf_counter() - start)
+    result['frame_set'] = summarize(frame_times)
+
+    # UI list drawing: all the rows of all the lists
+    draw_times = []
+    layout = DrawLayout()
+    for _ in range(args.repeat):
+        for obj in ska_objects:
+            context = DrawContext(obj)
+            start = time.perf_counter()
+            for group in obj.ska_groups:
+                for index, item in enumerate(group.keys):
+                    duska.DUSKA_UL_keys.draw_item(None, context, layout, group, item, 0, group, 'active_index', index)
+            draw_times.append(time.perf_counter() - start)
+    result['draw'] = summarize(draw_times)
+
+    # Operators
+    move_times = []
+    remove_times = []
+    if params['lists'] > 0:
+        view_layer = bpy.context.view_layer
+        for obj in ska_objects:
+            view_layer.objects.active = obj
+            obj.ska_groups[0].active_index = 0
+            start = time.perf_counter()
+            bpy.ops.object.ska_move_key(up=False, listIndex=0)
+            move_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            bpy.ops.object.ska_remove_key(delete=False, listIndex=0)
+            remove_times.append(time.perf_counter() - start)
+    result['move_key'] = summarize(move_times)
+    result['remove_key'] = summarize(remove_times)
+
+    return result
+
+def main():
+    args = get_arguments()
+
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'frames': args.frames,
+        'repeat': args.repeat,
+        'seed': args.seed,
+    }
+    if bpy is not None:
+        import addon_utils # pylint: disable=import-error
+        addon_utils.enable('duska', default_set=True)
+        import duska # pylint: disable=import-error
+        info['backend'] = 'blender'
+        info['blender'] = bpy.app.version_string
+        info['duska'] = '.'.join(str(v) for v in duska.bl_info['version'])
+        run = lambda params: blender_benchmark(duska, args, params)
+    else:
+        standin = load_standin()
+        info['backend'] = 'standin'
+        run = lambda params: standin_benchmark(standin, args, params)
+
+    results = []
+    for params in args.scenes:
+        result = dict(params)
+        result.update( run(params) )
+        results.append(result)
+
+    output = json.dumps({ 'info': info, 'results': results }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()